@@ -1,6 +1,21 @@
 from abc import ABCMeta, abstractmethod
+import binascii
+import bisect
+import collections
+import hashlib
+import itertools
+import json
+import marshal
+import mmap
+import multiprocessing
 import operator
+import os
 import random
+import re
+import string
+import struct
+import sys
+import numpy as np
 
 def andmap(b,L):
     return reduce(operator.and_, [b(x) for x in L])
@@ -8,9 +23,7 @@ def andmap(b,L):
 def ormap(b,L):
     return reduce(operator.or_, [b(x) for x in L])
 
-# TODO : Define a DNAmol, Genome
 # TODO : Allow non-complementary double strand creation (perhaps with warning?)
-# TODO : Ligation with different rotations
 
 def find_sub_list(sl,l):
     sll=len(sl)
@@ -18,40 +31,100 @@ def find_sub_list(sl,l):
     for ind in (i for i,e in enumerate(l) if e==sl[0]):
         if l[ind:ind+sll]==sl:
             return ind
-        else:
-            return False
+    return False
 
 def process_strand(strand):
-    """Get a list of Nucleotides from various input types and verify correctness
+    """Get the packed bases from various input types and verify correctness
        of input.
-       String OR List<Nucleotide> OR Single_strand -> List<Nucleotide>"""
+       String OR List<Nucleotide> OR Single_strand OR Packed_bases
+       -> Packed_bases"""
     if isinstance(strand, str):
-        strand = list(strand)
-        return map(lambda b: Nucleotide(b), strand)
+        return Packed_bases.from_string(strand)
+    elif isinstance(strand, Packed_bases):
+        return strand
     elif isinstance(strand, Single_strand):
         return strand.bases
-    elif isinstance(strand, list) and \
-        len(filter(lambda b: not isinstance(b, Nucleotide), strand))==0:
-        return strand
-    else:
-        raise ValueError("Invalid input to create DNA molecule: " + str(type(strand))) 
+    elif isinstance(strand, list):
+        try:
+            return Packed_bases.from_string(
+                "".join([b.symbol for b in strand]))
+        except AttributeError:
+            pass
+    raise ValueError("Invalid input to create DNA molecule: " + str(type(strand))) 
+
+# Ambiguous (IUPAC) bases allowed in recognition sites, and their pairs
+_IUPAC_BASES = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'R': 'AG', 'Y': 'CT',
+                'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC', 'B': 'CGT',
+                'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'}
+_IUPAC_PAIRS = string.maketrans('ACGTRYSWKMBDHVN', 'TGCAYRSWMKVHDBN')
+
+def _site_reverse_complement(site):
+    """Reverse complement of a recognition site that may be ambiguous
+       String -> String"""
+    return site.translate(_IUPAC_PAIRS)[::-1]
+
+def _site_anchor(site):
+    """The longest run of the site without N, as (offset, run); only this
+       part is put in the automaton, so runs of N do not multiply patterns
+       String -> (int, String)"""
+    runs = [(len(run.group()), -run.start(), run.group())
+            for run in re.finditer('[^N]+', site)]
+    if not runs:
+        return 0, site
+    length, offset, run = max(runs)
+    return -offset, run
+
+def _site_pattern(site):
+    """Regular expression matching an ambiguous site (not empty bases)
+       String -> Regex"""
+    return re.compile("".join(["[" + _IUPAC_BASES[base] + "]"
+                               for base in site]))
+
+def _expand_site(site):
+    """Every plain sequence an ambiguous recognition site matches
+       String -> List<String>"""
+    return ["".join(bases) for bases
+            in itertools.product(*[_IUPAC_BASES[base] for base in site])]
 
 class Restriction_enzyme(object):
     """Represents a restriction enzyme to cut DNA"""
     
-    def __init__(self, recog_site, cut_site):
-        """Constructor for restriciton enzyme
-           List<Nucleotide> int -> Restriction_enzyme"""
+    def __init__(self, recog_site, cut_site, bottom_cut=None, name=None):
+        """Constructor for restriciton enzyme.  The site may be a string
+           with ambiguous IUPAC bases (e.g. GGNCC).  cut_site is where the
+           strand with the site is cut and bottom_cut where the other strand
+           is, both as offsets from the start of the site along it; by
+           default the cut is symmetric (len - cut_site).
+           List<Nucleotide> OR String int int String -> Restriction_enzyme"""
         self.recog_site = recog_site
         self.cut_site = cut_site
+        if bottom_cut is None:
+            bottom_cut = len(recog_site) - cut_site
+        self.bottom_cut = bottom_cut
+        self.name = name
+        if len(self.site_string().translate(None, 'ACGTRYSWKMBDHVN')) != 0:
+            raise ValueError("Invalid recognition site: " + str(recog_site))
     
     def __eq__(self, other):
         """Override equals method"""
         if isinstance(other, Restriction_enzyme):
-            return self.recog_site == other.recog_site and \
-                 self.cut_site == other.cut_site
+            return self.site_string() == other.site_string() and \
+                 self.cut_site == other.cut_site and \
+                 self.bottom_cut == other.bottom_cut
         else:
             return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.content_hash()
+
+    def content_hash(self):
+        """Stable hash of the recognition site and cut sites
+           -> int"""
+        return _mix_hashes(map(ord, self.site_string()) +
+                           [self.cut_site, self.bottom_cut])
             
     def __len__(self):
         return len(self.recog_site)
@@ -59,33 +132,278 @@ class Restriction_enzyme(object):
     def __str__(self):
         """Override string method"""
         out = '<'
+        site = self.site_string()
         for i in range(len(self)):
             if i == self.cut_site:
                 out += "|"
-            out = out + str(self.recog_site[i])
+            out = out + site[i]
         return out + '>'
+    
+    def site_string(self):
+        """The recognition site as a string of bases
+           -> String"""
+        if isinstance(self.recog_site, str):
+            return self.recog_site.upper()
+        return "".join([b.symbol for b in self.recog_site])
+    
+    def cut_positions(self, start, forward=True):
+        """Where the two strands are cut for a recognition site at start,
+           as (5'->3' strand, 3'->5' strand) positions along the 5'->3'
+           strand.  forward is False for a site on the 3'->5' strand, which
+           is then the strand cut at cut_site (read in its own direction).
+           int Boolean -> (int, int)"""
+        if forward:
+            return (start + self.cut_site, start + self.bottom_cut)
+        else:
+            return (start + len(self) - self.bottom_cut,
+                    start + len(self) - self.cut_site)
+
+class Enzyme_panel(object):
+    """Any number of restriction enzymes compiled into one Aho-Corasick
+       automaton, so a molecule is searched for all of them in one pass"""
+    
+    def __init__(self, enzymes):
+        """Restriction_enzyme OR List<Restriction_enzyme> -> Enzyme_panel"""
+        if isinstance(enzymes, Restriction_enzyme):
+            enzymes = [enzymes]
+        self.enzymes = list(enzymes)
+        self.max_site_length = max([len(e) for e in self.enzymes] or [0])
+        self._forward = self._compile(False)
+        self._both = self._compile(True)
+        self._checks = {}
+    
+    def __len__(self):
+        return len(self.enzymes)
+    
+    @staticmethod
+    def cached(enzymes, cache_dir):
+        """Enzyme_panel(enzymes), with the compiled automata saved in
+           cache_dir the first time and loaded from there by later processes
+           in milliseconds, instead of compiling hundreds of (ambiguous)
+           sites again.  Each set of enzymes has its own file.
+           List<Restriction_enzyme> String -> Enzyme_panel"""
+        enzymes = list(enzymes)
+        key = hashlib.md5(repr([_PANEL_CACHE_VERSION] +
+                               [(e.site_string(), e.cut_site, e.bottom_cut)
+                                for e in enzymes])).hexdigest()
+        path = os.path.join(cache_dir, 'enzyme_panel_' + key + '.marshal')
+        try:
+            with open(path, 'rb') as cache_file:
+                tables = marshal.load(cache_file)
+        except (IOError, EOFError, ValueError, TypeError):
+            tables = None
+        if tables is None:
+            panel = Enzyme_panel(enzymes)
+            temp = path + '.' + str(os.getpid())
+            with open(temp, 'wb') as cache_file:
+                marshal.dump((panel._forward, panel._both), cache_file, 2)
+            os.rename(temp, path)
+            return panel
+        panel = Enzyme_panel.__new__(Enzyme_panel)
+        panel.enzymes = enzymes
+        panel.max_site_length = max([len(e) for e in enzymes] or [0])
+        panel._forward, panel._both = tables
+        panel._checks = {}
+        return panel
+    
+    def _compile(self, both_strands):
+        """Build the automaton for the recognition sites (and their reverse
+           complements if both_strands).  Returns the transition table
+           (state -> {base -> state}) and the matches ending in each state as
+           (distance back to the site start, index of the enzyme, forward,
+           whether the rest of the site must be checked) tuples.
+           Boolean -> (List<Dict>, List<List<(int, int, Boolean, Boolean)>>)"""
+        goto = [{}]
+        matches = [[]]
+        for ind, enzyme in enumerate(self.enzymes):
+            site = enzyme.site_string()
+            sites = [(site, True)]
+            reverse = _site_reverse_complement(site)
+            if both_strands and reverse != site:
+                sites.append((reverse, False))
+            for site, forward in sites:
+                offset, anchor = _site_anchor(site)
+                checked = anchor != site
+                for pattern in _expand_site(anchor):
+                    state = 0
+                    for base in pattern:
+                        if base not in goto[state]:
+                            goto.append({})
+                            matches.append([])
+                            goto[state][base] = len(goto) - 1
+                        state = goto[state][base]
+                    matches[state].append((offset + len(pattern), ind,
+                                           forward, checked))
+        # Breadth first, fill in every missing transition from the failure
+        # links so scanning never has to backtrack
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = dict((base, goto[0].get(base, 0)) for base in _BASE_CODES)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            matches[state] = matches[state] + matches[fail[state]]
+            delta[state] = dict(delta[fail[state]])
+            for base, child in goto[state].items():
+                fail[child] = delta[fail[state]][base] if state else 0
+                delta[state][base] = child
+                queue.append(child)
+        for row in delta:
+            row[" "] = 0
+        return delta, matches
+    
+    def _site_check(self, ind, forward):
+        """Pattern for a whole site that is only partly in the automata,
+           compiled the first time it is needed
+           int Boolean -> Regex"""
+        key = (ind, forward)
+        if key not in self._checks:
+            site = self.enzymes[ind].site_string()
+            if not forward:
+                site = _site_reverse_complement(site)
+            self._checks[key] = _site_pattern(site)
+        return self._checks[key]
+    
+    def find_sites(self, bases, both_strands=True):
+        """Every recognition site in the bases, in one left-to-right pass, as
+           (start, enzyme, forward) tuples sorted by start
+           String OR Packed_bases Boolean -> List<(int, Restriction_enzyme, Boolean)>"""
+        if both_strands:
+            delta, matches = self._both
+        else:
+            delta, matches = self._forward
+        enzymes = self.enzymes
+        text = str(bases).upper()
+        sites = []
+        state = 0
+        for end, base in enumerate(text, 1):
+            state = delta[state][base]
+            for back, ind, forward, checked in matches[state]:
+                start = end - back
+                if checked and (start < 0 or not
+                                self._site_check(ind, forward).match(text,
+                                                                     start)):
+                    continue
+                sites.append((start, enzymes[ind], forward))
+        sites.sort(key=operator.itemgetter(0))
+        return sites
+    
+    def cut_sites(self, ds):
+        """Sorted (5'->3' strand, 3'->5' strand) cut positions of all the
+           enzymes on both strands of a double strand.  Sites that are not
+           fully double stranded are not cut, nor are sites of enzymes that
+           cut outside them (e.g. BbvI, AjuI) where a cut would be off the
+           molecule.
+           Double_strand -> List<(int, int)>"""
+        cuts = set()
+        for start, enzyme, forward in self.find_sites(ds.paired_bases()):
+            cut = enzyme.cut_positions(start, forward)
+            if _on_molecule(cut, len(ds)):
+                cuts.add(cut)
+        return sorted(cuts)
+    
+    def digest(self, ds):
+        """Cut the double strand with every enzyme in the panel
+           Double_strand -> List<Double_strand>"""
+        return ds.cut(self.cut_sites(ds))
+
+def _on_molecule(cut, n):
+    """Whether both positions of a (5'->3' strand, 3'->5' strand) cut are on
+       a linear molecule of n bases
+       (int, int) int -> Boolean"""
+    return 0 <= min(cut) and max(cut) <= n
+
+_PANEL_CACHE_VERSION = 2
+
+def _rebase_cut(value):
+    """Offset from the start of the site of a cut in an EMBOSS REBASE file,
+       where n > 0 is after the nth base of the site and n < 0 after the nth
+       base before it (there is no base 0)
+       int -> int"""
+    return value if value > 0 else value + 1
+
+class Enzyme_library(object):
+    """Restriction enzymes by name, read from a REBASE file in EMBOSS format
+       (emboss_e.###): one enzyme per line as name, site (IUPAC), site
+       length, number of cuts, blunt, then the cuts in the 5'->3' and
+       3'->5' strands.  Enzymes with unknown cuts are left out, and only the
+       first pair of cuts of enzymes that cut twice is used."""
+    
+    def __init__(self, filename, cache_dir=None):
+        """Read the library; panels are cached in cache_dir if given
+           String String -> Enzyme_library"""
+        self.filename = filename
+        self.cache_dir = cache_dir
+        self.enzymes = collections.OrderedDict()
+        with open(filename) as rebase:
+            for line in rebase:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                if len(fields) < 7:
+                    raise ValueError("Malformed REBASE line: " + line)
+                if int(fields[3]) == 0:
+                    continue
+                name = fields[0]
+                self.enzymes[name] = Restriction_enzyme(
+                    fields[1], _rebase_cut(int(fields[5])),
+                    _rebase_cut(int(fields[6])), name)
+    
+    def __len__(self):
+        return len(self.enzymes)
+    
+    def __iter__(self):
+        """The enzyme names, in file order"""
+        return iter(self.enzymes)
+    
+    def __contains__(self, name):
+        return name in self.enzymes
+    
+    def __getitem__(self, name):
+        return self.enzymes[name]
+    
+    def panel(self, names=None):
+        """An Enzyme_panel of the named enzymes (all of them by default),
+           loaded from the cache directory if it was compiled before
+           List<String> -> Enzyme_panel"""
+        if names is None:
+            enzymes = self.enzymes.values()
+        else:
+            enzymes = [self.enzymes[name] for name in names]
+        if self.cache_dir is None:
+            return Enzyme_panel(enzymes)
+        return Enzyme_panel.cached(enzymes, self.cache_dir)
 
 class Nucleotide(object):
-    """Concrete class representing A, C, T, or G base"""
+    """Concrete class representing A, C, T, or G base
+       There is exactly one instance per base (plus one empty base), so
+       Nucleotide("a") is Nucleotide("A") and comparison is by identity."""
+    
+    __slots__ = ('base', 'symbol', 'partner')
     
     base_matches = {'A':'T', 'T':'A', 'C':'G', 'G':'C', '':''}
     valid_bases = base_matches.keys()
+    _interned = {}
 
-    def __init__(self, base):
-        base = base.upper()
-        if base in self.valid_bases:
-            self.base = base
-        elif base == " ":
-            self.base = ""
-        else:
+    def __new__(cls, base):
+        try:
+            return cls._interned[base]
+        except (KeyError, TypeError):
             raise ValueError('Invalid base.  Must be one of A, C, T, G, or " "')
             
     def __eq__(self, other):
         """Override equals method"""
-        if isinstance(other, Nucleotide):
-            return self.base == other.base
-        else:
-            return False
+        return self is other
+    
+    def __ne__(self, other):
+        return self is not other
+    
+    def __hash__(self):
+        return id(self)
+    
+    def __reduce__(self):
+        """Unpickle to the interned instance"""
+        return (Nucleotide, (self.base,))
     
     def __str__(self):
         """Override string method"""
@@ -101,7 +419,7 @@ class Nucleotide(object):
         if base.is_empty() or self.is_empty():
             return True
         else:
-            return self.base_matches[self.base] == base.base
+            return self.partner is base
     
     def is_empty(self):
         """Is the base empty?
@@ -111,13 +429,578 @@ class Nucleotide(object):
     def pair(self):
         """Returns the complementary base
            -> Nucleotide"""
-        return Nucleotide(self.base_matches[self.base])
-        
+        return self.partner
+
+def _intern_nucleotides():
+    """Create the five Nucleotide instances and the lookup table from every
+       accepted spelling (upper/lower case, "" or " " for empty) to them"""
+    for base in Nucleotide.valid_bases:
+        nucleotide = object.__new__(Nucleotide)
+        nucleotide.base = base
+        nucleotide.symbol = base or " "
+        for spelling in set([base, base.lower(), nucleotide.symbol]):
+            Nucleotide._interned[spelling] = nucleotide
+    for base, match in Nucleotide.base_matches.items():
+        Nucleotide._interned[base].partner = Nucleotide._interned[match]
+
+_intern_nucleotides()
+
+# Packed storage: each base is 2 bits of a (long) integer, 5' base in the most
+# significant position.  A=00, C=01, G=10, T=11 so the complement of a base is
+# its code XOR 11.  Empty bases (sticky ends) are 00 in the sequence and 11 in
+# a separate gap mask of the same width, which stays 0 for blunt molecules.
+_BASE_CODES = 'ACGT'
+_ENCODE_BASES = string.maketrans('ACGTacgt ', '012301230')
+_ENCODE_GAPS = string.maketrans('ACGTacgt ', '000000003')
+_DECODE_BASES = ["".join([_BASE_CODES[(b >> s) & 3] for s in (6, 4, 2, 0)])
+                 for b in range(256)]
+_DECODE_GAPS = ["".join(["1" if (b >> s) & 3 else "0" for s in (6, 4, 2, 0)])
+                for b in range(256)]
+_REVERSE_CODES = "".join([chr(sum(((b >> s) & 3) << (6 - s)
+                                  for s in (0, 2, 4, 6)))
+                          for b in range(256)])
+_GAP_RUN = re.compile(r"1+")
+_GAP_BYTES = re.compile(r"[^\x00]+")
+# Concatenations longer than this are kept as ropes of parts
+_ROPE_CHUNK = 4096
+# Bases drawn from the random number generator at a time
+_RANDOM_BLOCK = 1 << 16
+
+def _ones(n):
+    """Mask covering n packed bases
+       int -> int"""
+    return (1 << (2 * n)) - 1
+
+def _to_bytes(value, n):
+    """Big-endian bytes holding n packed bases, padded at the 3' end
+       int int -> String"""
+    if n == 0:
+        return ""
+    pad = -n % 4
+    digits = '%x' % (value << (2 * pad))
+    return binascii.unhexlify(digits.zfill((n + pad) // 2))
+
+def _from_bytes(raw):
+    """Inverse of _to_bytes (without the padding)
+       String -> int"""
+    if len(raw) == 0:
+        return 0
+    return int(binascii.hexlify(raw), 16)
+
+def _unpack(value, n, table):
+    """Decode n packed bases to one character each through table
+       int int List<String> -> String"""
+    if n == 0:
+        return ""
+    return "".join(map(table.__getitem__, bytearray(_to_bytes(value, n))))[:n]
+
+def _reverse(value, n):
+    """Reverse the order of n packed bases
+       int int -> int"""
+    if n == 0:
+        return 0
+    # The 3' padding ends up as leading zeros, so no shift is needed
+    return _from_bytes(_to_bytes(value, n).translate(_REVERSE_CODES)[::-1])
+
+def _leading_gaps(gaps, n):
+    """Number of empty bases at the 5' end of a gap mask
+       int int -> int"""
+    filled = ~gaps & _ones(n)
+    return n - (filled.bit_length() + 1) // 2
+
+def _trailing_gaps(gaps, n):
+    """Number of empty bases at the 3' end of a gap mask
+       int int -> int"""
+    if gaps == _ones(n):
+        return n
+    return ((gaps ^ (gaps + 1)).bit_length() - 1) // 2
+
+def _extract(raw, start, stop):
+    """Packed bases [start, stop) out of the big-endian bytes of a sequence
+       String int int -> int"""
+    chunk_stop = (stop + 3) // 4
+    value = _from_bytes(raw[start // 4:chunk_stop])
+    return (value >> (2 * (4 * chunk_stop - stop))) & _ones(stop - start)
+
+# Content hashes are polynomials modulo a prime, with one digit per base (its
+# 2 packed bits, or its 2 gap bits), in a fixed random base: in base 4 the
+# Mersenne prime would let blocks of 61 bases swap places without changing
+# the hash
+_HASH_PRIME = (1 << 61) - 1
+_HASH_BASE = 0x0B7E151628AED2A6
+_HASH_BASE4 = pow(_HASH_BASE, 4, _HASH_PRIME)
+# Residue of each byte of 4 packed digits
+_HASH_BYTES = [sum([((b >> s) & 3) * pow(_HASH_BASE, s // 2, _HASH_PRIME)
+                    for s in (6, 4, 2, 0)]) % _HASH_PRIME for b in range(256)]
+# Residues are kept at every _HASH_STRIDE bytes of a sequence, so the hash of
+# any slice of it takes O(1) time
+_HASH_STRIDE = 16
+# 3 / (base - 1), as n digits 3 sum to 3 (base^n - 1) / (base - 1)
+_HASH_ONES = 3 * pow(_HASH_BASE - 1, _HASH_PRIME - 2, _HASH_PRIME) \
+    % _HASH_PRIME
+
+def _mix_hashes(values):
+    """One stable hash of a sequence of ints
+       List<int> -> int"""
+    mixed = 0
+    for value in values:
+        mixed = (mixed * 1000003 + value) % _HASH_PRIME
+    return mixed
+
+def _packed_from_bytes(length, raw_bits, gap_runs):
+    """Unpickle a Packed_bases from the big-endian bytes of its bits and its
+       runs of empty bases
+       int String List<(int, int)> -> Packed_bases"""
+    gaps = 0
+    for start, stop in gap_runs:
+        gaps |= _ones(stop - start) << (2 * (length - stop))
+    return Packed_bases(length, _extract(raw_bits, 0, length), gaps)
+
+def _join_residues(left, right, right_length):
+    """The (bits, gaps) residues of a concatenation, from those of its parts
+       (int, int) (int, int) int -> (int, int)"""
+    scale = pow(_HASH_BASE, right_length, _HASH_PRIME)
+    return ((left[0] * scale + right[0]) % _HASH_PRIME,
+            (left[1] * scale + right[1]) % _HASH_PRIME)
+
+def _ones_residue(n):
+    """Residue of n digits 3 (the gaps of n empty bases)
+       int -> int"""
+    return (pow(_HASH_BASE, n, _HASH_PRIME) - 1) * _HASH_ONES % _HASH_PRIME
+
+def _digits_residue(raw, start, stop, residue=0):
+    """residue followed by the 2-bit digits [start, stop) of big-endian bytes
+       String int int int -> int"""
+    for i in xrange(start, stop):
+        digit = (ord(raw[i >> 2]) >> (6 - 2 * (i & 3))) & 3
+        residue = (residue * _HASH_BASE + digit) % _HASH_PRIME
+    return residue
+
+def _bytes_residue(raw, start, stop, residue=0):
+    """residue followed by the digits of the bytes [start, stop)
+       String int int int -> int"""
+    for byte in bytearray(raw[start:stop]):
+        residue = (residue * _HASH_BASE4 + _HASH_BYTES[byte]) % _HASH_PRIME
+    return residue
+
+def _prefix_residues(raw):
+    """Residues of the first _HASH_STRIDE * k bytes (k = 0, 1, ...)
+       String -> List<int>"""
+    prefix = [0]
+    for start in xrange(0, len(raw) - _HASH_STRIDE + 1, _HASH_STRIDE):
+        prefix.append(_bytes_residue(raw, start, start + _HASH_STRIDE,
+                                     prefix[-1]))
+    return prefix
+
+def _range_residue(raw, prefix, start, stop):
+    """Residue of the digits [start, stop) of big-endian bytes, taking the
+       whole strides from their prefix residues
+       String List<int> int int -> int"""
+    first = (start + 3) // 4
+    last = stop // 4
+    if first >= last:
+        return _digits_residue(raw, start, stop)
+    residue = _digits_residue(raw, start, 4 * first)
+    lo = -(-first // _HASH_STRIDE)
+    hi = last // _HASH_STRIDE
+    if lo < hi:
+        residue = _bytes_residue(raw, first, lo * _HASH_STRIDE, residue)
+        scale = pow(_HASH_BASE, 4 * _HASH_STRIDE * (hi - lo), _HASH_PRIME)
+        residue = (residue * scale + prefix[hi] - prefix[lo] * scale) \
+            % _HASH_PRIME
+        first = hi * _HASH_STRIDE
+    residue = _bytes_residue(raw, first, last, residue)
+    return _digits_residue(raw, 4 * last, stop, residue)
+
+class Packed_bases(object):
+    """Immutable, compact sequence of bases (2 bits per base plus gap mask)
+       Slices, reversals and complements are O(1) views (offset, length,
+       orientation) onto the packed bases they came from, and long
+       concatenations are ropes (a list of parts); either only packs its own
+       bits the first time they are needed."""
+
+    __slots__ = ('length', '_bits', '_gaps', '_source', '_offset',
+                 '_reversed', '_complemented', '_raw', '_parts', '_starts',
+                 '_residues', '_prefix')
+
+    def __init__(self, length=0, bits=0, gaps=0):
+        """Wrap already packed bases; see from_string for text input
+           int int int -> Packed_bases"""
+        self.length = length
+        self._bits = bits
+        self._gaps = gaps
+        self._source = None
+        self._raw = None
+        self._parts = None
+        self._residues = None
+        self._prefix = None
+
+    @staticmethod
+    def _rope(parts, starts=None):
+        """Concatenation of the parts, without packing them together.  starts
+           are the offsets of the parts, if already known.
+           List<Packed_bases> List<int> -> Packed_bases"""
+        if len(parts) == 0:
+            return Packed_bases()
+        if len(parts) == 1:
+            return parts[0]
+        rope = Packed_bases.__new__(Packed_bases)
+        rope._bits = rope._gaps = rope._source = rope._raw = None
+        rope._residues = rope._prefix = None
+        rope._parts = parts
+        if starts is None:
+            starts = []
+            offset = 0
+            for part in parts:
+                starts.append(offset)
+                offset += part.length
+        rope._starts = starts
+        rope.length = starts[-1] + parts[-1].length
+        return rope
+
+    def _chunks(self):
+        """The non-empty parts of a rope, or [self]
+           -> List<Packed_bases>"""
+        if self._parts is not None:
+            return self._parts
+        return [self] if self.length > 0 else []
+
+    def _view(self, start, stop, reverse, complement):
+        """View of bases [start, stop) of self, optionally reversed and/or
+           complemented, sharing the packed bits of the original sequence
+           int int Boolean Boolean -> Packed_bases"""
+        if self._parts is not None:
+            return self._rope_view(start, stop, reverse, complement)
+        view = Packed_bases.__new__(Packed_bases)
+        view.length = max(0, stop - start)
+        view._bits = view._gaps = view._raw = view._parts = None
+        view._residues = view._prefix = None
+        if self._source is None:
+            view._source = self
+            view._offset = start
+            view._reversed = reverse
+            view._complemented = complement
+        else:
+            # Compose with this view so chains of views stay one level deep
+            view._source = self._source
+            if self._reversed:
+                view._offset = self._offset + self.length - start - view.length
+            else:
+                view._offset = self._offset + start
+            view._reversed = self._reversed != reverse
+            view._complemented = self._complemented != complement
+        return view
+
+    def _rope_view(self, start, stop, reverse, complement):
+        """_view of a rope: a rope of the parts it overlaps, with the parts
+           at either edge (or all of them, if reorienting) as views
+           int int Boolean Boolean -> Packed_bases"""
+        if start == 0 and stop == self.length and not reverse \
+                and not complement:
+            return self
+        if stop <= start:
+            return Packed_bases()
+        first = bisect.bisect_right(self._starts, start) - 1
+        last = bisect.bisect_left(self._starts, stop) - 1
+        if reverse or complement:
+            parts = [part._view(0, part.length, reverse, complement)
+                     for part in self._parts[first + 1:last]]
+        else:
+            parts = self._parts[first + 1:last]
+        first_part = self._parts[first]
+        lo = start - self._starts[first]
+        if first == last:
+            parts = [first_part._view(lo, stop - self._starts[first],
+                                      reverse, complement)]
+        else:
+            last_part = self._parts[last]
+            parts.insert(0, first_part._view(lo, first_part.length,
+                                             reverse, complement))
+            parts.append(last_part._view(0, stop - self._starts[last],
+                                         reverse, complement))
+        if reverse:
+            parts.reverse()
+        elif start == 0:
+            # Prefixes keep the offsets of their parts
+            return Packed_bases._rope(parts, self._starts[:len(parts)])
+        return Packed_bases._rope(parts)
+
+    def _source_bytes(self):
+        """Big-endian bytes of the bits and gaps, kept so views can pack
+           their region without shifting the whole sequence
+           -> (String, String)"""
+        if self._raw is None:
+            self._raw = (_to_bytes(self.bits, self.length),
+                         _to_bytes(self.gaps, self.length) if self.gaps else "")
+        return self._raw
+
+    def _materialize(self):
+        """Pack the region of the source this view covers, or all the parts
+           of this rope"""
+        if self._parts is not None:
+            packed = Packed_bases.from_string(str(self))
+            self._bits = packed._bits
+            self._gaps = packed._gaps
+            self._parts = None
+            return
+        raw_bits, raw_gaps = self._source._source_bytes()
+        start = self._offset
+        stop = start + self.length
+        bits = _extract(raw_bits, start, stop)
+        gaps = _extract(raw_gaps, start, stop) if raw_gaps else 0
+        if self._reversed:
+            bits = _reverse(bits, self.length)
+            gaps = _reverse(gaps, self.length)
+        if self._complemented:
+            bits = bits ^ _ones(self.length) ^ gaps
+        self._bits = bits
+        self._gaps = gaps
+        self._source = None
+
+    @property
+    def bits(self):
+        """The bases, 2 bits each, 5' base most significant
+           -> int"""
+        if self._bits is None:
+            self._materialize()
+        return self._bits
+
+    @property
+    def gaps(self):
+        """11 for every empty base and 00 for every other base
+           -> int"""
+        if self._gaps is None:
+            self._materialize()
+        return self._gaps
+
+    @staticmethod
+    def empty(n):
+        """n empty bases
+           int -> Packed_bases"""
+        return Packed_bases(n, 0, _ones(n))
+
+    @staticmethod
+    def from_string(bases):
+        """Pack a string of A, C, T, G (any case) and " " for empty bases
+           String -> Packed_bases"""
+        if len(bases.translate(None, 'ACGTacgt ')) != 0:
+            raise ValueError('Invalid base.  Must be one of A, C, T, G, or " "')
+        if len(bases) == 0:
+            return Packed_bases()
+        bits = int(bases.translate(_ENCODE_BASES), 4)
+        if " " in bases:
+            gaps = int(bases.translate(_ENCODE_GAPS), 4)
+        else:
+            gaps = 0
+        return Packed_bases(len(bases), bits, gaps)
+
+    def __eq__(self, other):
+        """Override equals method"""
+        if isinstance(other, Packed_bases):
+            return self.length == other.length and self.bits == other.bits \
+                and self.gaps == other.gaps
+        else:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.content_hash()
+
+    def __reduce__(self):
+        """Pickle as the packed bytes (of only the region, for views) and
+           the runs of empty bases, so molecules reach other processes
+           without their text or sources"""
+        return (_packed_from_bytes,
+                (self.length, _to_bytes(self.bits, self.length),
+                 _gap_runs(self)))
+
+    def residues(self):
+        """The bits and gaps as polynomials in _HASH_BASE modulo _HASH_PRIME,
+           which follow for a concatenation from those of its parts, and for
+           a slice from the prefix residues of its source, without reading
+           the bases again
+           -> (int, int)"""
+        if self._residues is None:
+            if self._parts is not None:
+                residues = (0, 0)
+                for part in self._parts:
+                    residues = _join_residues(residues, part.residues(),
+                                              part.length)
+            elif self._source is not None and not self._reversed:
+                bits, gaps = self._source._range_residues(
+                    self._offset, self._offset + self.length)
+                if self._complemented:
+                    bits = (_ones_residue(self.length) - gaps - bits) \
+                        % _HASH_PRIME
+                residues = (bits, gaps)
+            else:
+                residues = self._range_residues(0, self.length)
+            self._residues = residues
+        return self._residues
+
+    def _range_residues(self, start, stop):
+        """residues of the bases [start, stop) of a packed (not rope or view)
+           sequence
+           int int -> (int, int)"""
+        raw_bits, raw_gaps = self._source_bytes()
+        if self._prefix is None:
+            self._prefix = (_prefix_residues(raw_bits),
+                            _prefix_residues(raw_gaps) if raw_gaps else None)
+        bits = _range_residue(raw_bits, self._prefix[0], start, stop)
+        if not raw_gaps:
+            return (bits, 0)
+        return (bits, _range_residue(raw_gaps, self._prefix[1], start, stop))
+
+    def content_hash(self):
+        """Hash of the bases, the same in every process and run, so it can
+           key caches and files (which should still compare the bases, as
+           different bases can have the same hash).  Kept once computed,
+           passed on through concatenation and complement, and O(1) for
+           slices once their source is hashed.
+           -> int"""
+        bits, gaps = self.residues()
+        return _mix_hashes([self.length, bits, gaps])
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        """Override string method: bases as letters, empty bases as " " """
+        if self._parts is not None:
+            return "".join(map(str, self._parts))
+        out = _unpack(self.bits, self.length, _DECODE_BASES)
+        if self.gaps == 0:
+            return out
+        out = bytearray(out)
+        gap_str = _unpack(self.gaps, self.length, _DECODE_GAPS)
+        for run in _GAP_RUN.finditer(gap_str):
+            out[run.start():run.end()] = " " * (run.end() - run.start())
+        return str(out)
+
+    def __repr__(self):
+        return "Packed_bases(" + repr(str(self)) + ")"
+
+    def __iter__(self):
+        return iter(map(Nucleotide._interned.__getitem__, str(self)))
+
+    def __getitem__(self, ind):
+        """Index a single Nucleotide or slice out a new Packed_bases
+           int OR slice -> Nucleotide OR Packed_bases"""
+        if isinstance(ind, slice):
+            start, stop, step = ind.indices(self.length)
+            if step != 1:
+                raise ValueError("Packed_bases only supports contiguous slices")
+            return self.slice(start, stop)
+        if ind < 0:
+            ind += self.length
+        if not 0 <= ind < self.length:
+            raise IndexError("Packed_bases index out of range")
+        return Nucleotide._interned[str(self.slice(ind, ind + 1))]
+
+    def __add__(self, other):
+        """Concatenate other onto the 3' end.  Short results are packed
+           straight away; longer ones become a rope, so repeatedly appending
+           to a long sequence does not copy it every time.
+           Packed_bases -> Packed_bases"""
+        if self.length + other.length <= _ROPE_CHUNK:
+            shift = 2 * other.length
+            joined = Packed_bases(self.length + other.length,
+                                  (self.bits << shift) | other.bits,
+                                  (self.gaps << shift) | other.gaps)
+        else:
+            joined = self._join_rope(other)
+        if self._residues is not None and other._residues is not None:
+            joined._residues = _join_residues(self._residues,
+                                              other._residues, other.length)
+        return joined
+
+    def _join_rope(self, other):
+        """self + other as a rope, merging small neighbouring parts
+           Packed_bases -> Packed_bases"""
+        parts = list(self._chunks())
+        starts = list(self._starts) if self._parts is not None else [0]
+        for part in other._chunks():
+            if parts and parts[-1].length + part.length <= _ROPE_CHUNK:
+                parts[-1] = parts[-1] + part
+            else:
+                if parts:
+                    starts.append(starts[-1] + parts[-1].length)
+                parts.append(part)
+        return Packed_bases._rope(parts, starts[:len(parts)])
+
+    def slice(self, start, stop):
+        """Bases in [start, stop), clamped to [0, len(self)] like a list
+           slice (but without negative indexes), so views and ropes never
+           read past their own ends
+           int int -> Packed_bases"""
+        start = max(0, min(start, self.length))
+        stop = max(start, min(stop, self.length))
+        return self._view(start, stop, False, False)
+
+    def complement(self):
+        """Pair every base in place (empty bases stay empty)
+           -> Packed_bases"""
+        view = self._view(0, self.length, False, True)
+        if self._residues is not None:
+            bits, gaps = self._residues
+            view._residues = ((_ones_residue(self.length) - gaps - bits)
+                              % _HASH_PRIME, gaps)
+        return view
+
+    def reverse(self):
+        """Reverse the order of the bases
+           -> Packed_bases"""
+        return self._view(0, self.length, True, False)
+
+    def reverse_complement(self):
+        """The strand that would anneal to this one, 5'->3'
+           -> Packed_bases"""
+        return self._view(0, self.length, True, True)
+
+    def mismatches(self, other):
+        """Mask that is nonzero in every 2-bit group where a base does not
+           pair with the base at the same position of other.  Empty bases
+           pair with anything.  Both must be the same length.
+           Packed_bases -> int"""
+        mismatch = self.bits ^ other.bits ^ _ones(self.length)
+        return mismatch & ~(self.gaps | other.gaps)
+
+    def pairs_with(self, other):
+        """Does every base pair with the base at the same position of other?
+           Empty bases pair with anything.
+           Packed_bases -> Boolean"""
+        if self.length != other.length:
+            return False
+        return self.mismatches(other) == 0
+
+    def first_mismatch(self, other):
+        """Index of the first base that does not pair with the base at the
+           same position of other, the shorter length if the shorter one pairs
+           completely but the lengths differ, or -1 if every base pairs
+           Packed_bases -> int"""
+        n = min(self.length, other.length)
+        mismatch = self.slice(0, n).mismatches(other.slice(0, n))
+        if mismatch != 0:
+            return n - 1 - (mismatch.bit_length() - 1) // 2
+        elif self.length != other.length:
+            return n
+        else:
+            return -1
+
+    def remove_empties(self):
+        """Drop all empty bases
+           -> Packed_bases"""
+        if self.gaps == 0:
+            return self
+        return Packed_bases.from_string(str(self).replace(" ", ""))
+
 class Single_strand(object):
     """Represents a single stranded DNA molecule"""
     
     def __init__(self, bases):
-        """String OR List<Nucleotide> -> Single_strand"""
+        """String OR List<Nucleotide> OR Packed_bases -> Single_strand"""
         self.bases = process_strand(bases)
             
     def __eq__(self, other):
@@ -127,11 +1010,20 @@ class Single_strand(object):
         else:
             return False
     
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return self.content_hash()
+    
+    def content_hash(self):
+        """Stable hash of the bases (see Packed_bases.content_hash)
+           -> int"""
+        return self.bases.content_hash()
+    
     def __str__(self):
         """Override string method"""
-        out = '['
-        for b in self.bases: out += str(b)
-        return out + ']'
+        return '[' + str(self.bases).replace(" ", "") + ']'
         
     def __repr__(self):
         return str(self)
@@ -144,167 +1036,465 @@ class Single_strand(object):
            given ind.  0 <= ind <= size(self)
            int -> List<Single_strand>"""
         fragments = []
-        fragments.append(Single_strand(self.bases[0:ind]))
-        fragments.append(Single_strand(self.bases[ind:len(self)]))
+        fragments.append(Single_strand(self.bases.slice(0, ind)))
+        fragments.append(Single_strand(self.bases.slice(ind, len(self))))
         return fragments
     
     def reverse_strand(self):
         """Reverse the strand into 3' -> 5' order (for annealing purposes)
            -> Single_strand"""
-        new_bases = self.bases[::-1]
-        return Single_strand(new_bases)
+        return Single_strand(self.bases.reverse())
     
     def is_complementary(self, ss):
         """Do all of the bases on the strands pair?
            Single_strand -> Boolean"""
-        # TODO : Some way to handle if they match with an offset
-        if len(self.bases) == 0 and len(ss.bases) == 0:
-            return True
-        elif len(self.bases) != len(ss.bases):
-            return False
-        else:
-            pairs = zip(self.bases, ss.reverse_strand().bases)
-            return andmap(lambda p: p[0].is_complementary(p[1]), pairs)
+        # See find_binding to match with an offset or mismatches
+        return self.bases.pairs_with(ss.bases.reverse())
+    
+    def first_mismatch(self, ss):
+        """Index (from the 5' end of self) of the first base that does not
+           pair with ss, or -1 if the strands are complementary
+           Single_strand -> int"""
+        return self.bases.first_mismatch(ss.bases.reverse())
             
     def is_palindromic(self):
         """Is the sequence palindromic? (second half self-complimentary)
         -> Boolean"""
-        paired = Double_strand(self)
-        match_strands = paired.anneal()
-        return match_strands[0] == match_strands[1]
+        return self.bases == self.bases.reverse_complement()
+    
+    def find_palindromes(self, min_length=4, max_length=None):
+        """Palindromic sites along the strand (see find_palindromes)
+           int int -> (Array<int>, Array<int>)"""
+        return find_palindromes(self.bases, min_length, max_length)
+    
+    def find_binding(self, probe, max_errors=0, indels=True):
+        """Where a probe (e.g. a primer, 5'->3') can anneal to the strand at
+           any offset, allowing max_errors mismatches (and unpaired bases if
+           indels), as (start, end, errors) along the strand
+           Single_strand OR String int Boolean -> List<(int, int, int)>"""
+        target = process_strand(probe).remove_empties().reverse_complement()
+        return approximate_matches(target, self.bases, max_errors, indels)
     
     def remove_empties(self):
         """Remove empty bases from the strand
            -> SingleStrand"""
-        return Single_strand(filter(lambda b: not b.is_empty(), self.bases))
+        return Single_strand(self.bases.remove_empties())
     
     def ligate(self, ss):
         """Append the two single strands, including getting rid of empties
            Adds ss to the 3' end of self
            Single_strand -> Single_strand"""
-        self_clean_bases = self.remove_empties().bases
-        ss_clean_bases = ss.remove_empties().bases
-        self_clean_bases.extend(ss_clean_bases)
-        return Single_strand(self_clean_bases)
+        return Single_strand(self.bases.remove_empties() + \
+            ss.bases.remove_empties())
         
-    def restrict(self, enzyme):
-        """Cut the strand into pieces if it has the recog_site
-           Restriction_enzyme -> Single_strand or List<DNAmol>"""
-        recog_ind = find_sub_list(enzyme.recog_site, self.bases)
-        print self
-        print type(recog_ind)
-        if not recog_ind is False:
-            temp_segments = self.split(recog_ind + enzyme.cut_site)
-            print temp_segments
-            all_segments = [temp_segments[0]]
-            other_segments = temp_segments[1].restrict(enzyme)
-            all_segments.extend(other_segments)
-            return all_segments
-        else:
-            return [self]
+    def restrict(self, enzymes):
+        """Cut the strand into pieces at every recog_site (except where an
+           enzyme that cuts outside its site would cut off the strand)
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<Single_strand>"""
+        if not isinstance(enzymes, Enzyme_panel):
+            enzymes = Enzyme_panel(enzymes)
+        cuts = set()
+        for start, enzyme, forward in enzymes.find_sites(self.bases, False):
+            cut = start + enzyme.cut_site
+            if 0 <= cut <= len(self):
+                cuts.add(cut)
+        fragments = []
+        prev = 0
+        for cut in sorted(cuts) + [len(self)]:
+            if cut > prev:
+                fragments.append(Single_strand(self.bases.slice(prev, cut)))
+                prev = cut
+        return fragments
         
+def _random_table(gc_content):
+    """Translation table from random bytes to bases, with the G/C fraction
+       of the table as close to gc_content as 1/256 allows
+       float -> String"""
+    if not 0 <= gc_content <= 1:
+        raise ValueError("GC content must be between 0 and 1")
+    gc = int(round(gc_content * 256))
+    return "".join([("CG" if b < gc else "AT")[b % 2] for b in range(256)])
+
+def random_bases(n, gc_content=0.5, seed=None):
+    """Stream n random bases as strings of up to _RANDOM_BLOCK bases.  Each
+       block is one getrandbits call translated to bases through a table, so
+       there is no per-base Python work.  The same seed always gives the
+       same bases.
+       int float Hashable -> Iterator<String>"""
+    rng = random.Random(seed)
+    table = _random_table(gc_content)
+    for start in xrange(0, n, _RANDOM_BLOCK):
+        size = min(_RANDOM_BLOCK, n - start)
+        raw = '%x' % rng.getrandbits(8 * size)
+        yield binascii.unhexlify(raw.zfill(2 * size)).translate(table)
+
+def first_mismatch_batch(pairs):
+    """Single_strand.first_mismatch for many pairs of strands at once: all
+       the pairs are packed end to end and compared in one operation
+       List<(Single_strand, Single_strand)> -> List<int>"""
+    strands1 = []
+    strands2 = []
+    for ss1, ss2 in pairs:
+        n = min(len(ss1), len(ss2))
+        strands1.append(str(ss1.bases)[:n])
+        strands2.append(str(ss2.bases)[::-1][:n])
+    packed1 = Packed_bases.from_string("".join(strands1))
+    packed2 = Packed_bases.from_string("".join(strands2))
+    flags = _unpack(packed1.mismatches(packed2), len(packed1), _DECODE_GAPS)
+    results = []
+    offset = 0
+    for (ss1, ss2), strand in zip(pairs, strands1):
+        ind = flags.find("1", offset, offset + len(strand))
+        if ind >= 0:
+            results.append(ind - offset)
+        elif len(ss1) != len(ss2):
+            results.append(len(strand))
+        else:
+            results.append(-1)
+        offset += len(strand)
+    return results
+
+def complementary_batch(pairs):
+    """Single_strand.is_complementary for many pairs of strands at once
+       List<(Single_strand, Single_strand)> -> List<Boolean>"""
+    return [ind == -1 for ind in first_mismatch_batch(pairs)]
+
+# Empty bases pair with nothing, so their complement matches no symbol
+_PALINDROME_TABLE = string.maketrans('ACGT ', 'TGCA#')
+
+def find_palindromes(bases, min_length=4, max_length=None):
+    """Every reverse-complement palindrome (e.g. GAATTC) of at least
+       min_length bases, in one linear pass (Manacher's algorithm, with
+       "equal" replaced by "complementary").  Palindromes have even length,
+       so each is found at its centre: returned as arrays of starts and of
+       lengths, the longest at that centre up to max_length.  The shorter
+       palindromes at the same centre are inside it.
+       String OR Packed_bases -> (Array<int>, Array<int>)"""
+    bases = str(bases).upper()
+    pairs = bases.translate(_PALINDROME_TABLE)
+    n = len(bases)
+    # radii[i] is half the longest palindrome centred before bases[i]
+    radii = [0] * (n + 1)
+    centre = right = 0
+    for i in xrange(n + 1):
+        k = 0
+        if i < right:
+            # The mirror image in the palindrome around centre pairs too
+            k = min(radii[2 * centre - i], right - i)
+        while k < i and i + k < n and bases[i - 1 - k] == pairs[i + k]:
+            k += 1
+        radii[i] = k
+        if i + k > right:
+            centre, right = i, i + k
+    radii = np.array(radii)
+    lengths = 2 * radii
+    if max_length is not None:
+        lengths = np.minimum(lengths, max_length - max_length % 2)
+    found = np.flatnonzero(lengths >= max(min_length, 1))
+    lengths = lengths[found]
+    return found - lengths // 2, lengths
+
+# The 2-bit codes of the four bases in each byte of packed bits
+_BYTE_CODES = ["".join([chr((b >> s) & 3) for s in (6, 4, 2, 0)])
+               for b in range(256)]
+# Code of an empty base, which matches nothing
+_EMPTY_CODE = 4
+
+def _base_codes(bases):
+    """One byte per base, read straight from the packed bits: the base's
+       code (0-3 for A, C, G, T) or _EMPTY_CODE
+       String OR Packed_bases -> bytearray"""
+    if isinstance(bases, str):
+        bases = Packed_bases.from_string(bases)
+    n = len(bases)
+    codes = bytearray("".join(map(_BYTE_CODES.__getitem__,
+                                  bytearray(_to_bytes(bases.bits, n))))[:n])
+    for start, stop in _gap_runs(bases):
+        codes[start:stop] = chr(_EMPTY_CODE) * (stop - start)
+    return codes
+
+def _match_masks(pattern):
+    """For each code, the mask with bit i set where pattern[i] has it
+       bytearray -> List<int>"""
+    masks = [0] * (_EMPTY_CODE + 1)
+    for ind, code in enumerate(pattern):
+        masks[code] |= 1 << ind
+    masks[_EMPTY_CODE] = 0
+    return masks
+
+def _edit_distances(pattern, text, anchored=False):
+    """Myers' bit-parallel edit distance: for every end in text, the fewest
+       substitutions, insertions and deletions turning some text ending
+       there (starting anywhere, or at 0 if anchored) into pattern
+       bytearray bytearray Boolean -> Iterator<int>"""
+    m = len(pattern)
+    masks = _match_masks(pattern)
+    mask = _ones(m)
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for code in text:
+        eq = masks[code]
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) | anchored
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+        yield score
+
+def _mismatch_counts(pattern, text, max_errors):
+    """Bitap (shift-and) with mismatches: for every end in text, the
+       mismatches between pattern and the text ending there, or
+       max_errors + 1 if more (or if the text is too short)
+       bytearray bytearray int -> Iterator<int>"""
+    masks = _match_masks(pattern)
+    mask = _ones(len(pattern))
+    high = 1 << (len(pattern) - 1)
+    # states[d] has bit i set where pattern[:i + 1] ends here with <= d
+    states = [0] * (max_errors + 1)
+    for code in text:
+        eq = masks[code]
+        carry = 0
+        for errors in range(max_errors + 1):
+            shifted = ((states[errors] << 1) | 1) & mask
+            states[errors], carry = (shifted & eq) | carry, shifted
+        errors = 0
+        while errors <= max_errors and not states[errors] & high:
+            errors += 1
+        yield errors
+
+def approximate_matches(pattern, text, max_errors=0, indels=True):
+    """Every place pattern occurs in text with at most max_errors
+       substitutions (and insertions or deletions if indels), as
+       (start, end, errors) sorted by start.  Empty bases in text match
+       nothing.  With indels, an alignment usually also matches, with more
+       errors, a little shorter or longer: of the ends aligning from the
+       same start only the best is given, and ends inside an alignment with
+       fewer errors are left out.  Exact matches are always given.
+       String OR Packed_bases String OR Packed_bases int Boolean
+       -> List<(int, int, int)>"""
+    if isinstance(pattern, str):
+        pattern = pattern.replace(" ", "")
+    pattern = _base_codes(pattern)
+    text = _base_codes(text)
+    m = len(pattern)
+    if m == 0:
+        return []
+    if not indels:
+        return [(end + 1 - m, end + 1, errors) for end, errors
+                in enumerate(_mismatch_counts(pattern, text, max_errors))
+                if errors <= max_errors]
+    reverse = pattern[::-1]
+    best = {}
+    for end, errors in enumerate(_edit_distances(pattern, text), 1):
+        if errors > max_errors:
+            continue
+        # Align backwards from the end to find where the match starts
+        window = text[max(0, end - m - errors):end][::-1]
+        distances = list(_edit_distances(reverse, window, True))
+        start = end - distances.index(min(distances)) - 1
+        if start not in best or errors < best[start][2]:
+            best[start] = (start, end, errors)
+    # One error count at a time, so every alignment with fewer errors is
+    # known: sorted by start, with the furthest end of any up to each
+    matches = []
+    starts, reach = [], []
+    for errors in range(max_errors + 1):
+        for start, end, _ in [match for match in best.itervalues()
+                              if match[2] == errors]:
+            ind = bisect.bisect_right(starts, end - 1)
+            if errors == 0 or ind == 0 or reach[ind - 1] < end:
+                matches.append((start, end, errors))
+        matches.sort()
+        starts = [match[0] for match in matches]
+        reach = []
+        for match in matches:
+            reach.append(max(match[1], reach[-1] if reach else 0))
+    return matches
+
+def _cut_strand(bases, start, end, cut_start, cut_end):
+    """Bases [cut_start, cut_end) padded with empty bases to [start, end)
+       String int int int int -> Packed_bases"""
+    if cut_end <= cut_start:
+        # Overlapping sites can cut this strand out of the fragment
+        return Packed_bases.empty(end - start)
+    return Packed_bases.from_string(" " * (cut_start - start) + \
+        bases[cut_start:cut_end] + " " * (end - cut_end))
+
+def _cut_residues(bases, start, end, cut_start, cut_end):
+    """residues of _cut_strand, from those of the slice of the uncut bases
+       Packed_bases int int int int -> (int, int)"""
+    if cut_end <= cut_start:
+        return (0, _ones_residue(end - start))
+    residues = _join_residues((0, _ones_residue(cut_start - start)),
+                              bases.slice(cut_start, cut_end).residues(),
+                              cut_end - cut_start)
+    return _join_residues(residues, (0, _ones_residue(end - cut_end)),
+                          end - cut_end)
+
+def _ladder_rungs():
+    """The two lines drawn for each pair of base symbols in draw_ladder
+       -> Dictionary<String, String>"""
+    rungs = {}
+    for b1 in 'ACGT ':
+        for b2 in 'ACGT ':
+            ladder = ("|" if b1 != " " else " ") + "    " + \
+                ("|" if b2 != " " else " ")
+            rung = (b1 + "--" if b1 != " " else "   ") + \
+                ("--" + b2 if b2 != " " else "   ")
+            rungs[b1 + b2] = "\t" + ladder + "\n\t" + rung + "\n"
+    return rungs
+
+_LADDER_RUNGS = _ladder_rungs()
+_LADDER_CHUNK = 4096
+
 class Double_strand(object):
-    """Represents a double-stranded DNA molecule with a list of tuples"""
+    """Represents a double-stranded DNA molecule as two packed strands: the
+       5'->3' strand on top and the 3'->5' strand aligned underneath it"""
     
     def __init__(self, strand1, strand2 = None):
         """Create a double strand of DNA from a string or list
            String OR Single_strand OR List<Nucleotide> -> Double_strand"""
-        if isinstance(strand1, list) and \
+        if isinstance(strand1, list) and len(strand1) > 0 and \
             len(filter(lambda b: not isinstance(b, tuple), strand1))==0:
-            self.base_pairs = strand1
+            top, bottom = zip(*strand1)
+            self.top = process_strand(list(top))
+            self.bottom = process_strand(list(bottom))
         else:
-            strand1 = process_strand(strand1)
+            self.top = process_strand(strand1)
             if strand2 is None:
-                strand2 = map(lambda b: b.pair(), strand1)
-                strand2.reverse()
+                self.bottom = self.top.complement()
             else:
-                strand2 = process_strand(strand2)
-            if Single_strand(strand1).is_complementary(Single_strand(strand2)):
-                strand2.reverse()
-                base_pairs = zip(strand1, strand2)
-                self.base_pairs = base_pairs
-            else:
-                raise ValueError("Input strands are not complementary")
+                self.bottom = process_strand(strand2).reverse()
+                if not self.top.pairs_with(self.bottom):
+                    raise ValueError("Input strands are not complementary")
+    
+    @staticmethod
+    def from_packed(top, bottom):
+        """Wrap two aligned packed strands without copying or checking them
+           Packed_bases Packed_bases -> Double_strand"""
+        ds = Double_strand.__new__(Double_strand)
+        ds.top = top
+        ds.bottom = bottom
+        return ds
+    
+    @property
+    def base_pairs(self):
+        """The molecule as a list of (5'->3' base, 3'->5' base) tuples
+           -> List<(Nucleotide, Nucleotide)>"""
+        return zip(self.top, self.bottom)
         
     def __eq__(self, other):
         """Override equals method"""
         if isinstance(other, Double_strand):
-            return self.base_pairs == other.base_pairs
+            return self.top == other.top and self.bottom == other.bottom
         else:
             return False
     
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return self.content_hash()
+    
+    def content_hash(self):
+        """Stable hash of both strands, sticky ends included
+           -> int"""
+        return _mix_hashes([self.top.content_hash(),
+                            self.bottom.content_hash()])
+    
     def __str__(self):
         """Override the string method"""
-        out = '['
-        for b in self.base_pairs:
-            out = out + str(b[0]) + str(b[1]) + " "
-        return out[0:-1] + ']'
+        pairs = zip(str(self.top), str(self.bottom))
+        return '[' + " ".join([(b1 + b2).replace(" ", "") for b1, b2 in pairs]) + ']'
         
     def __repr__(self):
         return str(self)
         
     def __len__(self):
-        return len(self.base_pairs)
+        return len(self.top)
     
     @staticmethod
-    def random_dna(n):
+    def random_dna(n, gc_content=0.5, seed=None):
         """Generate a string of n random base pairs of DNA.
-           No empty bases, blunt ends"""
-        bases = ['a','c','t','g']
-        rand_inds = [random.randint(0,len(bases)-1) for _ in range(n)]
-        rand_bases = map(lambda i: bases[i], rand_inds)
-        str_bases = "".join(rand_bases)
-        return Double_strand(str_bases)
+           No empty bases, blunt ends.  The same seed gives the same sequence
+           as random_bases (see there for gc_content).
+           int float Hashable -> Double_strand"""
+        top = Packed_bases._rope([Packed_bases.from_string(block) for block
+                                  in random_bases(n, gc_content, seed)])
+        return Double_strand.from_packed(top, top.complement())
     
     def split(self, ind):
         """Split the DNA into two double strands (with blunt ends) before the
            given ind.  0 <= ind <= size(self)
            int -> List<DoubleStrand>"""
         fragments = []
-        fragments.append(Double_strand(self.base_pairs[0:ind]))
-        fragments.append(Double_strand(self.base_pairs[ind:len(self)]))
+        fragments.append(Double_strand.from_packed(self.top.slice(0, ind),
+                                                   self.bottom.slice(0, ind)))
+        fragments.append(Double_strand.from_packed(
+            self.top.slice(ind, len(self)), self.bottom.slice(ind, len(self))))
         return fragments
     
     def strand53(self):
         """Get the 5'->3' strand out of the double strand
            -> Single_strand"""
-        strands = zip(*self.base_pairs);
-        if len(strands) == 0: strands = [[],[]]
-        new_strand = list(strands[0])
-        return Single_strand(new_strand)
+        return Single_strand(self.top)
         
     def strand35(self):
         """Get the 3'->5' strand out of the double strand
            Reverses it so that it ends up in the 5'->3' direction
            -> Single_strand"""
-        strands = zip(*self.base_pairs)
-        if len(strands) == 0: strands = [[],[]]
-        new_strand = list(strands[1])
-        return Single_strand(new_strand).reverse_strand()
+        return Single_strand(self.bottom.reverse())
         
     def anneal(self):
         """Split the Double_strand into 2 Single_strands
            List : [5'->3' strand, 3' ->5' strand] (but both in 5'->3' order)
-           -> Genome"""
+           -> List<Single_strand>"""
         return [self.strand53(), self.strand35()]
         
     def rotate(self):
         """Rotate the Double_strand 180 deg (still 5'->3' but change which
            strand is on top
            -> Double_strand"""
-        new_strands = self.anneal()
-        return Double_strand(new_strands[1], new_strands[0])
+        return Double_strand.from_packed(self.bottom.reverse(),
+                                         self.top.reverse())
+    
+    def _unpaired_gaps(self):
+        """Mask of the positions where either strand is empty
+           -> int"""
+        return self.top.gaps | self.bottom.gaps
+        
+    def _end_overhang(self, at_5):
+        """Length of the overhang at the 5' (or 3') end of the 5'->3' strand.
+           Only looks at the end: the window checked doubles until it reaches
+           a paired base, so the cost is proportional to the overhang.
+           Boolean -> int"""
+        n = len(self)
+        size = min(n, 16)
+        while True:
+            start = 0 if at_5 else n - size
+            gaps = self.top.slice(start, start + size).gaps | \
+                self.bottom.slice(start, start + size).gaps
+            if at_5:
+                overhang = _leading_gaps(gaps, size)
+            else:
+                overhang = _trailing_gaps(gaps, size)
+            if overhang < size or size == n:
+                return overhang
+            size = min(n, 2 * size)
         
     def overhang_5(self):
         """Return list of the overhang at the start of the double strand (5'
            end of leading strand) and paired portion
            -> List<Double_strand>"""
-        nonempty_inds = [i for i, b in enumerate(self.base_pairs) if \
-            (not b[0].is_empty() and not b[1].is_empty())]
-        if len(nonempty_inds) == 0:
-            split_ind = len(self)
-        else:
-            split_ind = nonempty_inds[0]
+        split_ind = self._end_overhang(True)
         split_strands = self.split(split_ind)
         return split_strands
     
@@ -312,91 +1502,1430 @@ class Double_strand(object):
         """Return list of the paired portion and the overhang at the end of 
            the double strand (3' end of the leading strand, in 5'->3' direction)
            -> DoubleStrand"""
-        nonempty_inds = [i for i, b in enumerate(self.base_pairs) if \
-            (not b[0].is_empty() and not b[1].is_empty())]
-        if len(nonempty_inds) == 0:
-            split_ind = 0
-        else:
-            split_ind = nonempty_inds[-1] + 1
+        split_ind = len(self) - self._end_overhang(False)
         split_strands = self.split(split_ind)
         return split_strands
         
-        tail = []
-        bases = self.base_pairs[::-1]
-        i = 0;
-        while i < len(bases) and \
-            (bases[i][0].is_empty() or bases[i][1].is_empty()):
-            tail.append(bases[i])
-            i += 1
-        tail.reverse()
-        if len(tail) == 0:
-            tail_strands = [[],[]]
-        else:
-            tail_strands = map(lambda s: list(s), zip(*tail))
-        return Double_strand(tail_strands[0], tail_strands[1])
-        
     def ligate(self, ds):
         """Turn 2 fragments into 1, if ends match, or return false
            Assumes both strands are in the 5'->3' direction
            Currently set up so to only ligate ds to end of self (no rotation)
            (There are 3 other combinations)
+           Only the overhangs are unpacked and paired; the bodies are joined
+           as views (a rope when long), so the cost does not grow with the
+           length of either molecule.
            Double_strand -> Double_strand OR false"""
         # Get overhang_3 of self
         self_overhang_3 = self.overhang_3()
         self_body = self_overhang_3[0]
-        self_tail3 = self_overhang_3[1]
         # Get overhang_5 of ds
         ds_overhang_5 = ds.overhang_5()
-        ds_tail5 = ds_overhang_5[0]
         ds_body = ds_overhang_5[1]
-        # Anneal and ligate ds_tail to end of self_tail
-        self_tail3 = self_tail3.anneal()
-        ds_tail5 = ds_tail5.anneal()
-        overlap_53 = self_tail3[0].ligate(ds_tail5[0])
-        overlap_35 = self_tail3[1].ligate(ds_tail5[1])
-        # Remove empties
-        overlap_53 = overlap_53.remove_empties()
-        overlap_35 = overlap_35.remove_empties()
+        overlap = Double_strand._join_overhangs(self_overhang_3[1],
+                                                ds_overhang_5[0])
+        if overlap is False:
+            return False
+        # stick together all 3 pieces
+        return Double_strand.from_packed(
+            self_body.top + overlap.top + ds_body.top,
+            self_body.bottom + overlap.bottom + ds_body.bottom)
+    
+    @staticmethod
+    def _join_overhangs(tail3, tail5):
+        """The double stranded overlap made by pairing a 3' end overhang with
+           a 5' end overhang, or False if they do not pair
+           Double_strand Double_strand -> Double_strand OR false"""
+        # Anneal and ligate tail5 to end of tail3
+        tail3 = tail3.anneal()
+        tail5 = tail5.anneal()
+        overlap_53 = tail3[0].ligate(tail5[0])
+        overlap_35 = tail3[1].ligate(tail5[1])
         # Check if 2 strands are complementary
         if overlap_53.is_complementary(overlap_35):
             # Combine if they are (into DS)
-            overlap = Double_strand(overlap_53, overlap_35)
-            # stick together all 3 pieces
-            new_body = []
-            new_body.extend(self_body.base_pairs)
-            new_body.extend(overlap.base_pairs)
-            new_body.extend(ds_body.base_pairs)
-            return Double_strand(new_body)
+            return Double_strand(overlap_53, overlap_35)
         else:
             return False
     
-    def restrict(self, enzyme):
+    def self_ligate(self):
+        """Join the 3' end of the molecule to its own 5' end, if they match,
+           making a circular molecule whose origin is where the ends joined
+           -> Circular_strand OR false"""
+        overhang_5 = self.overhang_5()
+        head, rest = overhang_5
+        body, tail = rest.overhang_3()
+        overlap = Double_strand._join_overhangs(tail, head)
+        if overlap is False:
+            return False
+        return Circular_strand(Double_strand.from_packed(
+            body.top + overlap.top, body.bottom + overlap.bottom))
+    
+    def find_palindromes(self, min_length=4, max_length=None):
+        """Palindromic sites (candidate restriction sites and hairpins) in
+           the paired part of the molecule (see find_palindromes)
+           int int -> (Array<int>, Array<int>)"""
+        return find_palindromes(self.paired_bases(), min_length, max_length)
+    
+    def find_binding(self, probe, max_errors=0, indels=True):
+        """Where a probe (e.g. a primer, 5'->3') can anneal to either strand
+           with at most max_errors (see Single_strand.find_binding), as
+           (start, end, errors, forward) counted along the 5'->3' strand;
+           forward if it anneals to the 5'->3' strand
+           Single_strand OR String int Boolean
+           -> List<(int, int, int, Boolean)>"""
+        probe = process_strand(probe).remove_empties()
+        matches = [match + (True,) for match in approximate_matches(
+            probe.reverse_complement(), self.top, max_errors, indels)]
+        matches.extend([match + (False,) for match in approximate_matches(
+            probe, self.bottom.complement(), max_errors, indels)])
+        return sorted(matches)
+    
+    def paired_bases(self):
+        """The 5'->3' strand with every base that is not paired (sticky ends)
+           marked empty
+           -> Packed_bases"""
+        gaps = self._unpaired_gaps()
+        return Packed_bases(len(self), self.top.bits & ~gaps, gaps)
+    
+    def cut(self, cuts):
+        """Cut both strands at the given (5'->3' strand, 3'->5' strand)
+           positions, both counted along the 5'->3' strand, producing
+           fragments with sticky ends where the two positions differ.  Where
+           cuts overlap (e.g. overlapping degenerate sites), the bases between
+           them pair with nothing and fall away, so no fragment is produced
+           for them.
+           List<(int, int)> -> List<Double_strand>"""
+        n = len(self)
+        return self._between([(0, 0)] + sorted(cuts) + [(n, n)])
+    
+    def _between(self, bounds):
+        """The fragments between each pair of consecutive cuts in bounds
+           List<(int, int)> -> List<Double_strand>"""
+        # Slicing the packed integers costs O(len(self)) per fragment, so
+        # unpack once and pack each fragment from its own slice instead
+        top = str(self.top)
+        bottom = str(self.bottom)
+        # Fragments of a hashed molecule (e.g. in a Reaction_cache) take
+        # their hashes from its slices
+        hashed = self.top._residues is not None and \
+            self.bottom._residues is not None
+        fragments = []
+        prev_top, prev_bottom = bounds[0]
+        for cut_top, cut_bottom in bounds[1:]:
+            start = min(prev_top, prev_bottom)
+            end = max(cut_top, cut_bottom, start)
+            # Between overlapping cuts the two strands do not overlap, so
+            # nothing holds the single stranded pieces together
+            paired = max(prev_top, prev_bottom) < min(cut_top, cut_bottom)
+            if end > start and paired:
+                fragment = Double_strand.from_packed(
+                    _cut_strand(top, start, end, prev_top, cut_top),
+                    _cut_strand(bottom, start, end, prev_bottom, cut_bottom))
+                if hashed:
+                    fragment.top._residues = _cut_residues(
+                        self.top, start, end, prev_top, cut_top)
+                    fragment.bottom._residues = _cut_residues(
+                        self.bottom, start, end, prev_bottom, cut_bottom)
+                fragments.append(fragment)
+            prev_top, prev_bottom = cut_top, cut_bottom
+        return fragments
+    
+    def restrict(self, enzymes):
         """Cut the double stranded DNA at all restriction sites and produce a
            list of the fragments (may have sticky ends)
-           Restriction_enzyme -> List<Double_strand>"""
-        # Find restriction site on leading strand
-        # Figure out range that needs to be considered 
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<Double_strand>"""
+        if not isinstance(enzymes, Enzyme_panel):
+            enzymes = Enzyme_panel(enzymes)
+        return enzymes.digest(self)
             
-    def draw_ladder(self):
-        """Draw an ASCII art DNA ladder"""
-        print ""
-        for pair in self.base_pairs:
-            if pair[0].is_empty():
-                rungL = "   "
-                ladderL = " "
+    def _window(self, start, end, center, radius):
+        """The [start, end) range to draw, clipped to the molecule
+           int int int int -> (int, int)"""
+        if center is not None:
+            start, end = center - radius, center + radius
+        if end is None:
+            end = len(self)
+        return max(0, start), min(len(self), end)
+    
+    def draw_ladder(self, out=None, start=0, end=None, center=None,
+                    radius=20):
+        """Draw an ASCII art DNA ladder of the base pairs [start, end), or
+           radius either side of center (e.g. a feature or cut site).
+           Written to out (default standard output) in chunks of rungs.
+           file int int int int -> None"""
+        if out is None:
+            out = sys.stdout
+        start, end = self._window(start, end, center, radius)
+        out.write("\n")
+        for chunk in range(start, end, _LADDER_CHUNK):
+            stop = min(end, chunk + _LADDER_CHUNK)
+            pairs = map(operator.add, str(self.top.slice(chunk, stop)),
+                        str(self.bottom.slice(chunk, stop)))
+            out.write("".join(map(_LADDER_RUNGS.__getitem__, pairs)))
+        if end > start:
+            last = str(self.top.slice(end - 1, end)) + \
+                str(self.bottom.slice(end - 1, end))
+            out.write(_LADDER_RUNGS[last].split("\n")[0] + "\n")
+    
+    def draw_overview(self, out=None, width=60, marks=()):
+        """Draw the whole molecule compressed to width columns, one row per
+           strand: '=' where every base in the column is there, '-' where
+           some are and ' ' where none are.  A row of '^' shows the columns
+           with marks (e.g. cut sites) and the last row is a scale in bases.
+           file int List<int> -> None"""
+        if out is None:
+            out = sys.stdout
+        n = len(self)
+        per_column = max(1, -(-n // width))
+        rows = []
+        block = _LADDER_CHUNK * per_column
+        for strand in [self.top, self.bottom]:
+            row = []
+            for chunk in range(0, n, block):
+                text = str(strand.slice(chunk, min(n, chunk + block)))
+                for ind in range(0, len(text), per_column):
+                    empty = text.count(" ", ind, ind + per_column)
+                    if empty == 0:
+                        row.append("=")
+                    elif empty < min(per_column, len(text) - ind):
+                        row.append("-")
+                    else:
+                        row.append(" ")
+            rows.append("".join(row))
+        marked = set(mark // per_column for mark in marks if 0 <= mark < n)
+        rows.append("".join(["^" if col in marked else " "
+                             for col in range(len(rows[0]))]).rstrip())
+        rows.append("0" + str(n).rjust(max(len(rows[0]) - 1,
+                                           len(str(n)) + 1)))
+        out.write("".join(["\t" + row + "\n" for row in rows]))
+
+class Circular_strand(object):
+    """Represents a circular double-stranded DNA molecule (e.g. a plasmid) as
+       a ring of packed base pairs with a movable origin"""
+    
+    def __init__(self, strand1, strand2 = None):
+        """Close a molecule into a ring, with the origin at its first base.
+           The ring is blunt: every base must be paired.
+           Double_strand OR String OR Single_strand OR List<Nucleotide>
+           -> Circular_strand"""
+        if not isinstance(strand1, Double_strand):
+            strand1 = Double_strand(strand1, strand2)
+        if strand1._unpaired_gaps() != 0:
+            raise ValueError("Circular molecules cannot have sticky ends")
+        self.top = strand1.top
+        self.bottom = strand1.bottom
+        self.origin = 0
+    
+    def _with_origin(self, top, bottom, origin):
+        """Ring sharing the given packed strands with a new origin
+           Packed_bases Packed_bases int -> Circular_strand"""
+        ring = Circular_strand.__new__(Circular_strand)
+        ring.top = top
+        ring.bottom = bottom
+        ring.origin = origin % len(top) if len(top) > 0 else 0
+        return ring
+    
+    def __len__(self):
+        return len(self.top)
+    
+    def __eq__(self, other):
+        """Override equals method (same sequence read from the origin)"""
+        if isinstance(other, Circular_strand):
+            return self.linearize() == other.linearize()
+        else:
+            return False
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return self.content_hash()
+    
+    def content_hash(self):
+        """Stable hash of the ring read from its origin, distinct from the
+           same molecule linearized
+           -> int"""
+        return _mix_hashes([1, self.linearize().content_hash()])
+    
+    def __str__(self):
+        """Override the string method"""
+        return '(' + str(self.linearize())[1:-1] + ')'
+    
+    def __repr__(self):
+        return str(self)
+    
+    def rotate_origin(self, k):
+        """Move the origin k bases along the 5'->3' strand, without copying
+           int -> Circular_strand"""
+        return self._with_origin(self.top, self.bottom, self.origin + k)
+    
+    def rotate(self):
+        """Rotate the ring 180 deg (change which strand is on top)
+           -> Circular_strand"""
+        return self._with_origin(self.bottom.reverse(), self.top.reverse(),
+                                 -self.origin)
+    
+    def linearize(self):
+        """Open the ring at the origin (blunt ends)
+           -> Double_strand"""
+        n = len(self)
+        return Double_strand.from_packed(
+            self.top.slice(self.origin, n) + self.top.slice(0, self.origin),
+            self.bottom.slice(self.origin, n) + \
+                self.bottom.slice(0, self.origin))
+    
+    def find_sites(self, enzymes):
+        """Every recognition site on the ring, including sites across the
+           origin, as (start, enzyme, forward) with start along the ring
+           from the origin.  Only the first few bases are scanned twice.
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<(int, Restriction_enzyme, Boolean)>"""
+        if not isinstance(enzymes, Enzyme_panel):
+            enzymes = Enzyme_panel(enzymes)
+        n = len(self)
+        bases = self.linearize().top
+        wrap = min(n, max(enzymes.max_site_length - 1, 0))
+        sites = enzymes.find_sites(str(bases) + str(bases.slice(0, wrap)))
+        return [site for site in sites if site[0] < n]
+    
+    def cut_sites(self, enzymes):
+        """Sorted (5'->3' strand, 3'->5' strand) cut positions along the ring
+           from the origin, each pair shifted so the smaller is in [0, n)
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<(int, int)>"""
+        cuts = set()
+        for start, enzyme, forward in self.find_sites(enzymes):
+            cuts.add(self._ring_cut(enzyme.cut_positions(start, forward)))
+        return sorted(cuts, key=lambda cut: (min(cut), cut))
+    
+    def _ring_cut(self, cut):
+        """Shift a (5'->3' strand, 3'->5' strand) cut by whole turns of the
+           ring so the smaller position is in [0, n)
+           (int, int) -> (int, int)"""
+        shift = (min(cut) // len(self)) * len(self)
+        return (cut[0] - shift, cut[1] - shift)
+    
+    def restrict(self, enzymes):
+        """Cut the ring at all restriction sites.  A ring with no sites is
+           returned whole; k cuts give k linear fragments (may have sticky
+           ends; fewer where cuts overlap, see Double_strand.cut), starting
+           with the one after the first cut from the origin.
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<Double_strand> OR List<Circular_strand>"""
+        cuts = self.cut_sites(enzymes)
+        if len(cuts) == 0:
+            return [self]
+        n = len(self)
+        # Open the ring at the first cut and append just enough of the start
+        # to finish the fragment that wraps around to that cut again
+        first = min(cuts[0])
+        bounds = [(top - first, bottom - first) for top, bottom in cuts]
+        bounds.append((bounds[0][0] + n, bounds[0][1] + n))
+        extra = max(max(bound) for bound in bounds) - n
+        linear = self.rotate_origin(first).linearize()
+        linear = Double_strand.from_packed(
+            linear.top + linear.top.slice(0, extra),
+            linear.bottom + linear.bottom.slice(0, extra))
+        return linear._between(bounds)
+
+class Reaction_cache(object):
+    """Results of restriction digests and ligations, remembered by the
+       molecules and enzymes (found by their content hashes, then compared
+       base by base), so the repeats in a design sweep are not recomputed.
+       Holds at most max_size results, dropping the least recently used."""
+    
+    def __init__(self, max_size=1024):
+        """int -> Reaction_cache"""
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        
+    def __len__(self):
+        return len(self._results)
+    
+    def _lookup(self, key, react):
+        """The result stored under key, or react() (stored under key)"""
+        if key in self._results:
+            result = self._results.pop(key)
+            self.hits += 1
+        else:
+            result = react()
+            self.misses += 1
+            if len(self._results) >= self.max_size > 0:
+                self._results.popitem(last=False)
+        if self.max_size > 0:
+            self._results[key] = result
+        return result
+    
+    def restrict(self, dna, enzymes):
+        """dna.restrict(enzymes), remembered
+           Double_strand OR Circular_strand OR Single_strand
+           Restriction_enzyme OR List<Restriction_enzyme> OR Enzyme_panel
+           -> List<Double_strand OR Single_strand>"""
+        if isinstance(enzymes, Enzyme_panel):
+            enzyme_list = enzymes.enzymes
+        elif isinstance(enzymes, Restriction_enzyme):
+            enzyme_list = [enzymes]
+        else:
+            enzyme_list = enzymes
+        # The order and repeats of the enzymes do not change the digest
+        key = ('restrict', dna, frozenset(enzyme_list))
+        return list(self._lookup(key, lambda: dna.restrict(enzymes)))
+    
+    def ligate(self, dna1, dna2):
+        """dna1.ligate(dna2), remembered
+           Double_strand Double_strand -> Double_strand OR false"""
+        key = ('ligate', dna1, dna2)
+        return self._lookup(key, lambda: dna1.ligate(dna2))
+    
+    def stats(self):
+        """Hits, misses, hit rate and size
+           -> Dictionary<String, Number>"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'size': len(self), 'max_size': self.max_size}
+    
+    def clear(self):
+        """Forget every result and reset the statistics"""
+        self._results.clear()
+        self.hits = self.misses = 0
+
+def _end_key(top, bottom, right):
+    """Index key of a sticky end, from the single stranded bases of the
+       5'->3' strand (top) and of the 3'->5' strand read 5'->3' (bottom).
+       A right end and a left end can ligate exactly when their keys are
+       equal; ends with bases on both strands get None.
+       String String Boolean -> (String, String) OR None"""
+    if len(top) == 0 and len(bottom) == 0:
+        return ('blunt', '')
+    elif len(top) == 0:
+        # 5' overhang on the 3'->5' strand: the other end must supply its
+        # complement on the 5'->3' strand (and vice versa for left ends)
+        bottom = str(Packed_bases.from_string(bottom).reverse_complement())
+        return ('5', bottom) if right else ('3', bottom)
+    elif len(bottom) == 0:
+        return ('3', top) if right else ('5', top)
+    else:
+        return None
+
+class Fragment_pool(object):
+    """A pool of Double_strand fragments indexed by their sticky ends, to
+       find every pair that can be ligated in any of the four orientations
+       (each fragment as it is or rotated) without trying all pairs"""
+    
+    def __init__(self, fragments):
+        """List<Double_strand> -> Fragment_pool"""
+        self.fragments = list(fragments)
+        # left end key -> [(fragment index, rotated)]
+        self._left_ends = collections.defaultdict(list)
+        self._right_ends = []
+        self._unindexed_left = []
+        for ind, fragment in enumerate(self.fragments):
+            for rotated in (False, True):
+                ds = self.oriented(ind, rotated)
+                left = _end_key(*self._end_strands(ds.overhang_5()[0]),
+                                right=False)
+                right = _end_key(*self._end_strands(ds.overhang_3()[1]),
+                                 right=True)
+                if left is None:
+                    self._unindexed_left.append((ind, rotated))
+                else:
+                    self._left_ends[left].append((ind, rotated))
+                self._right_ends.append((ind, rotated, right))
+    
+    def __len__(self):
+        return len(self.fragments)
+    
+    @staticmethod
+    def _end_strands(end):
+        """The bases of both strands of an overhang, 5'->3', without empties
+           Double_strand -> (String, String)"""
+        top, bottom = end.anneal()
+        return (str(top.bases).replace(" ", ""),
+                str(bottom.bases).replace(" ", ""))
+    
+    def oriented(self, ind, rotated):
+        """Fragment ind, rotated 180 deg if rotated
+           int Boolean -> Double_strand"""
+        if rotated:
+            return self.fragments[ind].rotate()
+        return self.fragments[ind]
+    
+    def compatible_pairs(self):
+        """Every ligation of two different fragments, as (first fragment,
+           first rotated, second fragment, second rotated) with the second
+           ligated to the 3' end of the first.  Each product is listed once
+           (A + B and rot(B) + rot(A) are the same molecule).
+           -> List<(int, Boolean, int, Boolean)>"""
+        pairs = []
+        unindexed = set(self._unindexed_left)
+        for ind, rotated, key in self._right_ends:
+            if key is None:
+                candidates = [end for ends in self._left_ends.values()
+                              for end in ends]
             else:
-                rungL = str(pair[0]) + "--"
-                ladderL = "|"
-            if pair[1].is_empty():
-                rungR = "   "
-                ladderR = " "
+                candidates = self._left_ends.get(key, [])
+            candidates = candidates + self._unindexed_left
+            for other, other_rotated in candidates:
+                if other <= ind:
+                    continue
+                if key is None or (other, other_rotated) in unindexed:
+                    # Ends with bases on both strands need a full check
+                    if self.oriented(ind, rotated).ligate(
+                            self.oriented(other, other_rotated)) is False:
+                        continue
+                pairs.append((ind, rotated, other, other_rotated))
+        return pairs
+    
+    def ligations(self):
+        """Every molecule made by ligating two different fragments
+           -> Iterator<Double_strand>"""
+        for ind, rotated, other, other_rotated in self.compatible_pairs():
+            yield self.oriented(ind, rotated).ligate(
+                self.oriented(other, other_rotated))
+
+def _lineage_seed(seed, ind, generation):
+    """Seed for one lineage from one generation on, the same in any process
+       Hashable int int -> int"""
+    key = "%r:%d:%d" % (seed, ind, generation)
+    return int(hashlib.md5(key).hexdigest(), 16)
+
+def _simulate_lineages(task):
+    """Worker for Population.simulate: mutate a block of lineages.
+       Mutations arrive as a Poisson process over base-generations, so the
+       time to the next one is exponential and generations without any
+       mutation cost nothing.
+       (int, List<int>, Hashable, int, int, (float, float, float))
+       -> List<(int, List<(int, String, int, Any)>)>"""
+    first, lengths, seed, start, generations, rates = task
+    substitution, insertion, deletion = rates
+    total = substitution + insertion + deletion
+    results = []
+    for ind, length in enumerate(lengths, first):
+        rng = random.Random(_lineage_seed(seed, ind, start))
+        mutations = []
+        time = 0.0
+        while length > 0 and total > 0:
+            time += rng.expovariate(length * total)
+            if time >= generations:
+                break
+            generation = start + int(time)
+            kind = rng.random() * total
+            if kind < substitution:
+                mutations.append((generation, 'S', rng.randrange(length),
+                                  rng.randint(1, 3)))
+            elif kind < substitution + insertion:
+                mutations.append((generation, 'I', rng.randint(0, length),
+                                  rng.choice(_BASE_CODES)))
+                length += 1
+            else:
+                mutations.append((generation, 'D', rng.randrange(length), 1))
+                length -= 1
+        results.append((length, mutations))
+    return results
+
+class Population(object):
+    """Independent lineages of a (blunt) ancestor molecule, replicated for
+       many generations with random substitutions, insertions and deletions.
+       Every lineage is stored only as its list of mutations against the
+       shared ancestor: (generation, kind, position, value) with kind 'S'
+       (value: 1-3 steps along A, C, G, T), 'I' (value: inserted base) or
+       'D' (value: 1 base deleted), positions in the sequence at the time."""
+    
+    # Lineages sent to a worker process at a time
+    block_size = 64
+    
+    def __init__(self, ancestor, lineages, substitution=0.0, insertion=0.0,
+                 deletion=0.0, seed=0):
+        """Rates are per base per generation
+           Double_strand int float float float Hashable -> Population"""
+        if ancestor._unpaired_gaps() != 0:
+            raise ValueError("The ancestor molecule must have blunt ends")
+        self.ancestor = ancestor
+        self.rates = (substitution, insertion, deletion)
+        self.seed = seed
+        self.generations = 0
+        self.lengths = [len(ancestor)] * lineages
+        self.mutations = [[] for _ in range(lineages)]
+    
+    def __len__(self):
+        return len(self.mutations)
+    
+    def simulate(self, generations, processes=None):
+        """Replicate every lineage for more generations, spread over a pool
+           of processes (all cores if None, in this process if 1).  The
+           result depends only on the seed, not on the number of processes.
+           int int -> Population"""
+        tasks = [(first, self.lengths[first:first + self.block_size],
+                  self.seed, self.generations, generations, self.rates)
+                 for first in range(0, len(self), self.block_size)]
+        if processes == 1:
+            blocks = map(_simulate_lineages, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                blocks = pool.map(_simulate_lineages, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        ind = 0
+        for block in blocks:
+            for length, mutations in block:
+                self.lengths[ind] = length
+                self.mutations[ind].extend(mutations)
+                ind += 1
+        self.generations += generations
+        return self
+    
+    def lineage(self, ind):
+        """The molecule at the end of lineage ind, built from the ancestor
+           int -> Double_strand"""
+        bases = bytearray(str(self.ancestor.top))
+        for generation, kind, pos, value in self.mutations[ind]:
+            if kind == 'S':
+                code = _BASE_CODES.index(chr(bases[pos]))
+                bases[pos] = _BASE_CODES[(code + value) % 4]
+            elif kind == 'I':
+                bases[pos:pos] = value
+            else:
+                del bases[pos:pos + value]
+        return Double_strand(str(bases))
+    
+    def mutation_counts(self):
+        """Number of mutations in every lineage
+           -> List<int>"""
+        return map(len, self.mutations)
+
+def fragment_sizes(cuts, length, circular=False):
+    """Sizes of the fragments (as len() of the Double_strands restrict would
+       return) from (5'->3' strand, 3'->5' strand) cut positions, without
+       building the fragments.  Circular cuts are as Circular_strand.cut_sites
+       gives them; an uncut ring is one fragment of the whole length.
+       List<(int, int)> OR Array int Boolean -> Array<int>"""
+    cuts = np.asarray(cuts, dtype=np.int64).reshape(-1, 2)
+    if circular:
+        if len(cuts) == 0:
+            return np.array([length], dtype=np.int64)
+        cuts = cuts[np.lexsort((cuts[:, 1], cuts[:, 0], cuts.min(axis=1)))]
+        bounds = np.vstack([cuts, cuts[:1] + length])
+    else:
+        cuts = cuts[np.lexsort((cuts[:, 1], cuts[:, 0]))]
+        bounds = np.vstack([[[0, 0]], cuts, [[length, length]]])
+    starts = bounds[:-1].min(axis=1)
+    ends = np.maximum(bounds[1:].max(axis=1), starts)
+    sizes = ends - starts
+    # As in Double_strand._between, nothing is left between overlapping cuts
+    paired = bounds[:-1].max(axis=1) < bounds[1:].min(axis=1)
+    return sizes[(sizes > 0) & paired]
+
+def panel_fragment_sizes(dna, panels):
+    """Fragment sizes of one molecule digested by each of many enzyme panels.
+       The molecule is scanned once for every enzyme in any panel; each
+       panel's cuts are then the union of its enzymes' cuts.
+       Double_strand OR Circular_strand List<List<Restriction_enzyme>>
+       -> List<Array<int>>"""
+    enzymes = {}
+    for panel in panels:
+        for enzyme in panel:
+            enzymes[id(enzyme)] = enzyme
+    union = Enzyme_panel(enzymes.values())
+    circular = isinstance(dna, Circular_strand)
+    if circular:
+        sites = dna.find_sites(union)
+    else:
+        sites = union.find_sites(dna.paired_bases())
+    cuts = collections.defaultdict(list)
+    for start, enzyme, forward in sites:
+        cut = enzyme.cut_positions(start, forward)
+        if circular:
+            cuts[id(enzyme)].append(dna._ring_cut(cut))
+        elif _on_molecule(cut, len(dna)):
+            cuts[id(enzyme)].append(cut)
+    sizes = []
+    for panel in panels:
+        panel_cuts = [cuts[id(enzyme)] for enzyme in panel if cuts[id(enzyme)]]
+        if panel_cuts:
+            panel_cuts = np.unique(np.vstack(panel_cuts), axis=0)
+        sizes.append(fragment_sizes(panel_cuts, len(dna), circular))
+    return sizes
+
+class Virtual_gel(object):
+    """Agarose gel simulation: fragment sizes binned on a log scale into lane
+       profiles.  Bin 0 is next to the wells (largest fragments); fragments
+       outside the size range pile up in the first or last bin."""
+    
+    def __init__(self, min_size=100, max_size=20000, bins=50):
+        """int int int -> Virtual_gel"""
+        self.edges = np.logspace(np.log10(min_size), np.log10(max_size),
+                                 bins + 1)
+    
+    def lane(self, sizes, by_mass=True):
+        """Intensity of each band of one lane: total base pairs per bin (as
+           stained DNA shows), or number of fragments if not by_mass
+           Array<int> Boolean -> Array<float>"""
+        sizes = np.clip(np.asarray(sizes, dtype=np.float64), self.edges[0],
+                        self.edges[-1])
+        weights = sizes if by_mass else None
+        return np.histogram(sizes, self.edges, weights=weights)[0][::-1]
+    
+    def lanes(self, size_lists, by_mass=True):
+        """Lane profiles for many digests, one row per digest
+           List<Array<int>> Boolean -> Array<float>"""
+        return np.vstack([self.lane(sizes, by_mass) for sizes in size_lists])
+    
+    @staticmethod
+    def distances(lanes):
+        """Pairwise L1 distance between lane profiles normalized to total 1,
+           e.g. to find the enzyme panels that give the most distinct gels
+           Array<float> -> Array<float>"""
+        lanes = np.asarray(lanes, dtype=np.float64)
+        totals = lanes.sum(axis=1, keepdims=True)
+        profiles = lanes / np.where(totals > 0, totals, 1)
+        return np.abs(profiles[:, None, :] - profiles[None, :, :]).sum(axis=2)
+    
+    def draw(self, lanes):
+        """Print an ASCII art gel, one column per lane, wells at the top"""
+        lanes = np.atleast_2d(lanes)
+        shades = " .:*#"
+        scale = lanes.max() or 1
+        levels = np.ceil(lanes / scale * (len(shades) - 1)).astype(int)
+        print "\t" + " ".join(["_"] * len(lanes))
+        for row in levels.T:
+            print "\t" + " ".join([shades[level] for level in row])
+
+# Ambiguous IUPAC codes (N, R, Y, ...) in sequence files become empty bases
+_SEQUENCE_TABLE = string.maketrans('NRYKMSWBDHVnrykmswbdhv.-',
+                                   ' ' * 24)
+_SEQUENCE_SPACE = '\r\n\t '
+
+def _clean_sequence(raw):
+    """Sequence text from a file, without line breaks and with ambiguous
+       bases empty, ready for Packed_bases.from_string
+       String -> String"""
+    return raw.translate(_SEQUENCE_TABLE, _SEQUENCE_SPACE)
+
+class Sequence_file(object):
+    """A FASTA or FASTQ file, memory-mapped and read one record (or window)
+       at a time straight into packed Double_strands"""
+    
+    chunk_size = 1 << 20
+    
+    def __init__(self, filename):
+        """String -> Sequence_file"""
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = ""
+        start = 0
+        while start < len(self._map) and self._map[start] in _SEQUENCE_SPACE:
+            start += 1
+        self._start = start
+        if start == len(self._map) or self._map[start] == '>':
+            self.format = 'fasta'
+        elif self._map[start] == '@':
+            self.format = 'fastq'
+        else:
+            raise ValueError("Not a FASTA or FASTQ file: " + filename)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Release the memory map and the file"""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+    
+    def _line_end(self, pos):
+        """Index of the end of the line containing pos (or of the file)
+           int -> int"""
+        end = self._map.find('\n', pos)
+        return len(self._map) if end < 0 else end
+    
+    def _spans(self):
+        """The name and byte range of the sequence of every record
+           -> Iterator<(String, int, int)>"""
+        mm = self._map
+        pos = self._start
+        while pos < len(mm):
+            header_end = self._line_end(pos)
+            name = mm[pos + 1:header_end].strip()
+            if self.format == 'fasta':
+                end = mm.find('\n>', header_end)
+                end = len(mm) if end < 0 else end + 1
+                yield name, header_end + 1, end
+                pos = end
             else:
-                rungR = "--" + str(pair[1])
-                ladderR = "|"
-            print "\t" + ladderL + "    " + ladderR
-            print "\t" + rungL + rungR
-        print "\t" + ladderL + "    " + ladderR
+                plus = mm.find('\n+', header_end)
+                if plus < 0:
+                    raise ValueError("Truncated FASTQ record: " + name)
+                yield name, header_end + 1, plus + 1
+                # Skip quality lines until they cover the whole sequence
+                length = len(_clean_sequence(mm[header_end + 1:plus + 1]))
+                pos = self._line_end(plus + 1) + 1
+                quality = 0
+                while quality < length and pos < len(mm):
+                    line_end = self._line_end(pos)
+                    quality += len(mm[pos:line_end].rstrip('\r'))
+                    pos = line_end + 1
+            while pos < len(mm) and mm[pos] in _SEQUENCE_SPACE:
+                pos += 1
+    
+    def __iter__(self):
+        return self.records()
+    
+    def records(self):
+        """Lazily read every record, packing it chunk_size bytes of the
+           file at a time into a rope, so no text of the whole record is made
+           -> Iterator<(String, Double_strand)>"""
+        for name, start, end in self._spans():
+            parts = []
+            for chunk_start in range(start, end, self.chunk_size):
+                chunk_end = min(end, chunk_start + self.chunk_size)
+                bases = _clean_sequence(self._map[chunk_start:chunk_end])
+                if bases:
+                    parts.append(Packed_bases.from_string(bases))
+            yield name, Double_strand(Packed_bases._rope(parts))
+    
+    def windows(self, size, step=None):
+        """Lazily read fixed-size windows of every record, reading the file
+           chunk_size bytes at a time so memory does not grow with record
+           length.  The last window of a record may be shorter.
+           int int -> Iterator<(String, int, Double_strand)>"""
+        step = step or size
+        for name, start, end in self._spans():
+            pending = ""
+            offset = 0
+            skip = 0
+            covered = 0
+            for chunk_start in range(start, end, self.chunk_size):
+                chunk_end = min(end, chunk_start + self.chunk_size)
+                chunk = _clean_sequence(self._map[chunk_start:chunk_end])
+                # Bases stepped over between windows when step > size
+                dropped = min(skip, len(chunk))
+                skip -= dropped
+                offset += dropped
+                pending += chunk[dropped:]
+                ind = 0
+                while len(pending) - ind >= size:
+                    bases = Packed_bases.from_string(pending[ind:ind + size])
+                    yield name, offset + ind, Double_strand(bases)
+                    covered = offset + ind + size
+                    ind += step
+                skip += max(0, ind - len(pending))
+                ind = min(ind, len(pending))
+                pending = pending[ind:]
+                offset += ind
+            if offset + len(pending) > covered and len(pending) > 0:
+                bases = Packed_bases.from_string(pending)
+                yield name, offset, Double_strand(bases)
+
+def write_fasta(out, name, bases, line_width=60):
+    """Write one FASTA record to a file-like object, streaming the bases
+       from any iterable of strings (e.g. random_bases) in fixed-width lines
+       File String Iterable<String> int -> None"""
+    out.write(">" + name + "\n")
+    pending = ""
+    for block in bases:
+        pending += block
+        lines = len(pending) // line_width
+        out.write("".join([pending[i:i + line_width] + "\n" for i
+                           in xrange(0, lines * line_width, line_width)]))
+        pending = pending[lines * line_width:]
+    if pending:
+        out.write(pending + "\n")
+
+def read_sequences(filename):
+    """Every record of a FASTA or FASTQ file, read lazily
+       String -> Iterator<(String, Double_strand)>"""
+    with Sequence_file(filename) as seq_file:
+        for record in seq_file:
+            yield record
+
+class _Interval_node(object):
+    """One interval in an Interval_index treap, ordered by (start, end,
+       serial), with the largest end anywhere in its subtree.  shift is an
+       offset not yet applied to the children."""
+    
+    __slots__ = ('start', 'end', 'serial', 'feature', 'priority', 'left',
+                 'right', 'max_end', 'size', 'shift')
+    
+    def __init__(self, start, end, serial, feature, priority):
+        self.start = start
+        self.end = end
+        self.serial = serial
+        self.feature = feature
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = end
+        self.size = 1
+        self.shift = 0
+
+def _shift_node(node, offset):
+    """Move a whole subtree by offset, the children lazily"""
+    if node is not None:
+        node.start += offset
+        node.end += offset
+        node.max_end += offset
+        node.shift += offset
+
+def _push(node):
+    if node.shift:
+        _shift_node(node.left, node.shift)
+        _shift_node(node.right, node.shift)
+        node.shift = 0
+
+def _refresh(node):
+    node.max_end = node.end
+    node.size = 1
+    for child in (node.left, node.right):
+        if child is not None:
+            node.size += child.size
+            if child.max_end > node.max_end:
+                node.max_end = child.max_end
+
+def _size(node):
+    return 0 if node is None else node.size
+
+def _end_start(node, last):
+    """Start of the first (or last) interval in a treap"""
+    while True:
+        _push(node)
+        child = node.right if last else node.left
+        if child is None:
+            return node.start
+        node = child
+
+def _split_nodes(node, key):
+    """The treap split into the nodes ordered before key and the rest
+       _Interval_node Tuple -> (_Interval_node, _Interval_node)"""
+    if node is None:
+        return None, None
+    _push(node)
+    if (node.start, node.end, node.serial) < key:
+        node.right, right = _split_nodes(node.right, key)
+        _refresh(node)
+        return node, right
+    else:
+        left, node.left = _split_nodes(node.left, key)
+        _refresh(node)
+        return left, node
+
+def _insert_node(node, new):
+    """Add a node to a treap, splitting only the subtree it goes above
+       _Interval_node _Interval_node -> _Interval_node"""
+    if node is None:
+        return new
+    _push(node)
+    key = (new.start, new.end, new.serial)
+    if new.priority > node.priority:
+        new.left, new.right = _split_nodes(node, key)
+        _refresh(new)
+        return new
+    if key < (node.start, node.end, node.serial):
+        node.left = _insert_node(node.left, new)
+    else:
+        node.right = _insert_node(node.right, new)
+    node.size += 1
+    if new.end > node.max_end:
+        node.max_end = new.end
+    return node
+
+def _merge_nodes(left, right):
+    """Join two treaps, every node of left ordered before those of right
+       _Interval_node _Interval_node -> _Interval_node"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        _push(left)
+        left.right = _merge_nodes(left.right, right)
+        _refresh(left)
+        return left
+    else:
+        _push(right)
+        right.left = _merge_nodes(left, right.left)
+        _refresh(right)
+        return right
+
+def _overlapping_nodes(node, start, end, found):
+    """Add the nodes overlapping [start, end) to found, in order.  Subtrees
+       that end before start, or begin after end, are never visited."""
+    while node is not None and node.max_end > start:
+        _push(node)
+        _overlapping_nodes(node.left, start, end, found)
+        if node.start >= end:
+            return
+        if node.end > start:
+            found.append(node)
+        node = node.right
+
+class Interval_index(object):
+    """Intervals [start, end), each with a feature, in a treap ordered by
+       start that also tracks the largest end below each node.  Finding the
+       k intervals overlapping a range takes O(log(n) + k); adding,
+       removing, splitting, joining and shifting take O(log(n))."""
+    
+    _priorities = random.Random(0)
+    _serials = itertools.count()
+    
+    def __init__(self, intervals=()):
+        """Build the index from (start, end, feature), in linear time after
+           sorting them
+           Iterable<(int, int, Any)> -> Interval_index"""
+        nodes = []
+        for start, end, feature in intervals:
+            nodes.append(self._node(start, end, feature))
+        nodes.sort(key=lambda node: (node.start, node.end, node.serial))
+        # The treap is the Cartesian tree of the priorities in key order
+        stack = []
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                _refresh(last)
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self._root = stack[0] if stack else None
+        while stack:
+            _refresh(stack.pop())
+        
+    def __len__(self):
+        return _size(self._root)
+    
+    def __iter__(self):
+        """Every (start, end, feature), by start"""
+        return iter(self.overlapping(float('-inf'), float('inf')))
+        
+    def add(self, start, end, feature):
+        """Add an interval with its feature
+           int int Any -> None"""
+        self._root = _insert_node(self._root, self._node(start, end, feature))
+    
+    def _node(self, start, end, feature):
+        if end <= start:
+            raise ValueError("Empty interval: %d-%d" % (start, end))
+        return _Interval_node(start, end, next(self._serials), feature,
+                              self._priorities.random())
+        
+    def remove(self, start, end, feature):
+        """Remove an interval added with these values
+           int int Any -> None"""
+        left, rest = _split_nodes(self._root, (start, end))
+        same, right = _split_nodes(rest, (start, end, float('inf')))
+        found = []
+        _overlapping_nodes(same, start, end, found)
+        matches = [node for node in found if node.feature == feature]
+        if matches:
+            serial = matches[0].serial
+            before, rest = _split_nodes(same, (start, end, serial))
+            same = _merge_nodes(before, _split_nodes(rest, (start, end,
+                                                            serial + 1))[1])
+        self._root = _merge_nodes(_merge_nodes(left, same), right)
+        if not matches:
+            raise ValueError("No such interval: %d-%d" % (start, end))
+    
+    def overlapping(self, start, end):
+        """Every (start, end, feature) overlapping [start, end), by start
+           int int -> List<(int, int, Any)>"""
+        found = []
+        _overlapping_nodes(self._root, start, end, found)
+        return [(node.start, node.end, node.feature) for node in found]
+    
+    def shift(self, offset):
+        """Move every interval by offset
+           int -> None"""
+        _shift_node(self._root, offset)
+        
+    def split(self, pos):
+        """Move the intervals into two new indexes, those before pos and
+           those after it (counted from pos).  Intervals across pos are
+           clipped into both.  Leaves self empty.
+           int -> (Interval_index, Interval_index)"""
+        crossing = [interval for interval in self.overlapping(pos, pos + 1)
+                    if interval[0] < pos]
+        for interval in crossing:
+            self.remove(*interval)
+        left, right = Interval_index(), Interval_index()
+        left._root, right._root = _split_nodes(self._root, (pos,))
+        right.shift(-pos)
+        for start, end, feature in crossing:
+            left.add(start, pos, feature)
+            right.add(0, end - pos, feature)
+        self.__init__()
+        return left, right
+    
+    def join(self, other, offset):
+        """Move the intervals of other into self, shifted by offset.  They
+           must then all start at or after the last interval of self.
+           Interval_index int -> None"""
+        if self._root is not None and other._root is not None:
+            last = _end_start(self._root, True)
+            if _end_start(other._root, False) + offset < last:
+                raise ValueError("Joined intervals must come after " +
+                                 str(last))
+        other.shift(offset)
+        self._root = _merge_nodes(self._root, other._root)
+        other.__init__()
+
+class Genome(object):
+    """Named DNA molecules (chromosomes, plasmids, fragments) with the
+       features annotated on each kept in an Interval_index, which follows
+       the molecules as they are split and ligated"""
+    
+    def __init__(self, segments=()):
+        """Iterable<(String, Double_strand OR Single_strand OR
+           Circular_strand)> -> Genome"""
+        self.segments = collections.OrderedDict()
+        self._features = {}
+        for name, dna in segments:
+            self.add_segment(name, dna)
             
+    def __len__(self):
+        return len(self.segments)
+    
+    def __iter__(self):
+        """The segment names, in the order they were added"""
+        return iter(self.segments)
+    
+    def __contains__(self, name):
+        return name in self.segments
+    
+    def __getitem__(self, name):
+        return self.segments[name]
+    
+    def add_segment(self, name, dna):
+        """String Double_strand OR Single_strand OR Circular_strand -> None"""
+        if name in self.segments:
+            raise ValueError("Segment already in genome: " + name)
+        self.segments[name] = dna
+        self._features[name] = Interval_index()
+        
+    def remove_segment(self, name):
+        """Remove a segment and its features
+           String -> Double_strand OR Single_strand OR Circular_strand"""
+        del self._features[name]
+        return self.segments.pop(name)
+    
+    def add_feature(self, name, start, end, feature):
+        """Annotate bases [start, end) of a segment with a feature
+           String int int Any -> None"""
+        if not 0 <= start < end <= len(self.segments[name]):
+            raise ValueError("Feature %d-%d outside segment %s" % \
+                (start, end, name))
+        self._features[name].add(start, end, feature)
+
+    def add_features(self, name, features):
+        """Annotate a segment with many (start, end, feature) at once, e.g.
+           from an annotation file (built in bulk if it has none yet)
+           String Iterable<(int, int, Any)> -> None"""
+        features = list(features)
+        n = len(self.segments[name])
+        for start, end, feature in features:
+            if not 0 <= start < end <= n:
+                raise ValueError("Feature %d-%d outside segment %s" % \
+                    (start, end, name))
+        index = self._features[name]
+        if len(index) == 0:
+            self._features[name] = Interval_index(features)
+        else:
+            for start, end, feature in features:
+                index.add(start, end, feature)
+
+    def remove_feature(self, name, start, end, feature):
+        """String int int Any -> None"""
+        self._features[name].remove(start, end, feature)
+        
+    def features(self, name, start=0, end=None):
+        """Every (start, end, feature) of a segment overlapping [start, end)
+           (the whole segment by default), by start
+           String int int -> List<(int, int, Any)>"""
+        if end is None:
+            end = len(self.segments[name])
+        return self._features[name].overlapping(start, end)
+    
+    def feature_count(self, name):
+        """String -> int"""
+        return len(self._features[name])
+    
+    def annotate_sites(self, name, enzymes):
+        """Add every recognition site on a segment as a feature (its
+           Restriction_enzyme), so sites() can find the ones in a range.
+           A site across the origin of a circular segment is added as its
+           two pieces.  Returns the number of sites.
+           String Restriction_enzyme OR List<Restriction_enzyme> OR
+           Enzyme_panel -> int"""
+        if not isinstance(enzymes, Enzyme_panel):
+            enzymes = Enzyme_panel(enzymes)
+        dna = self.segments[name]
+        if isinstance(dna, Circular_strand):
+            sites = dna.find_sites(enzymes)
+        elif isinstance(dna, Double_strand):
+            sites = enzymes.find_sites(dna.paired_bases())
+        else:
+            sites = enzymes.find_sites(dna.bases, False)
+        n = len(dna)
+        index = self._features[name]
+        for start, enzyme, forward in sites:
+            end = start + len(enzyme)
+            index.add(start, min(end, n), enzyme)
+            if end > n:
+                index.add(0, end - n, enzyme)
+        return len(sites)
+    
+    def sites(self, name, start=0, end=None):
+        """The annotated recognition sites overlapping [start, end)
+           String int int -> List<(int, int, Restriction_enzyme)>"""
+        return [site for site in self.features(name, start, end)
+                if isinstance(site[2], Restriction_enzyme)]
+    
+    def _check_names(self, removed, added):
+        for name in added:
+            if name in self.segments and name not in removed:
+                raise ValueError("Segment already in genome: " + name)
+    
+    def split(self, name, ind, left_name, right_name):
+        """Split a linear segment before ind (as Double_strand.split) into
+           two new segments.  The features go with their bases; features
+           across ind are clipped into both.
+           String int String String -> None"""
+        self._check_names([name], [left_name, right_name])
+        left, right = self.segments[name].split(ind)
+        left_index, right_index = self._features[name].split(ind)
+        self.remove_segment(name)
+        self.add_segment(left_name, left)
+        self.add_segment(right_name, right)
+        self._features[left_name] = left_index
+        self._features[right_name] = right_index
+        
+    def ligate(self, left_name, right_name, name):
+        """Ligate one segment onto the end of another (as
+           Double_strand.ligate), making a new segment with the features of
+           both.  The sticky ends that pair become the same bases, so a
+           feature on them in both molecules is merged into one.  Returns the
+           new molecule, or false (and changes nothing) if the ends do not
+           match.
+           String String String -> Double_strand OR false"""
+        self._check_names([left_name, right_name], [name])
+        left = self.segments[left_name]
+        right = self.segments[right_name]
+        joined = left.ligate(right)
+        if joined is False:
+            return False
+        index = self._features[left_name]
+        right_index = self._features[right_name]
+        # The right molecule's bases end the new one, sticky end included
+        offset = len(joined) - len(right)
+        # Its features starting on the bases it shares with the left one go
+        # in one at a time, merged with the same feature there
+        for start, end, feature in right_index.overlapping(
+                float('-inf'), len(left) - offset):
+            right_index.remove(start, end, feature)
+            start, end = start + offset, end + offset
+            for same in index.overlapping(start, end):
+                if same[2] == feature:
+                    index.remove(*same)
+                    start, end = min(start, same[0]), max(end, same[1])
+            index.add(start, end, feature)
+        index.join(right_index, offset)
+        self.remove_segment(left_name)
+        self.remove_segment(right_name)
+        self.add_segment(name, joined)
+        self._features[name] = index
+        return joined
+
+# Binary molecule files: a header, the bases packed 2 bits each, the runs of
+# empty bases of each strand, then metadata and a feature table as JSON.  A
+# double strand is stored as one sequence (each top base, or the pair of the
+# bottom base where the top is empty) and the empty runs of both strands.
+_MOLECULE_MAGIC = 'PDNA'
+_MOLECULE_VERSION = 1
+# magic, version, kind, length, top runs, bottom runs, metadata bytes,
+# feature bytes
+_MOLECULE_HEADER = struct.Struct('<4sBBxxQQQQQ')
+_MOLECULE_KINDS = [Single_strand, Double_strand, Circular_strand]
+
+def _gap_runs(bases):
+    """[start, stop) of every run of empty bases
+       Packed_bases -> List<(int, int)>"""
+    if bases.gaps == 0:
+        return []
+    raw = _to_bytes(bases.gaps, bases.length)
+    runs = []
+    # Only the bytes holding empty bases are decoded
+    for block in _GAP_BYTES.finditer(raw):
+        offset = 4 * block.start()
+        gap_str = "".join(map(_DECODE_GAPS.__getitem__,
+                              bytearray(block.group())))
+        for run in _GAP_RUN.finditer(gap_str):
+            start, stop = offset + run.start(), offset + run.end()
+            if runs and runs[-1][1] == start:
+                start = runs.pop()[0]
+            runs.append((start, stop))
+    return runs
+
+def _runs_mask(runs, start, stop):
+    """Gap mask of the bases [start, stop) from sorted runs of empty bases,
+       looking only at the runs that overlap them
+       np.array int int -> int"""
+    gaps = 0
+    first = np.searchsorted(runs[:, 1], start, side='right')
+    for run_start, run_stop in runs[first:]:
+        if run_start >= stop:
+            break
+        run_start = max(int(run_start), start)
+        run_stop = min(int(run_stop), stop)
+        gaps |= _ones(run_stop - run_start) << (2 * (stop - run_stop))
+    return gaps
+
+def write_molecule(out, dna, metadata=None, features=()):
+    """Write a molecule to a binary file-like object (see Molecule_file),
+       in about a quarter of the size of its text.  Rings are stored opened
+       at their origin.  metadata and the features (e.g. those of a Genome
+       segment) must be JSON values.
+       File Single_strand OR Double_strand OR Circular_strand Dictionary
+       Iterable<(int, int, Any)> -> None"""
+    kind = _MOLECULE_KINDS.index(type(dna))
+    if kind == 0:
+        strands = [dna.bases]
+        sequence = dna.bases.bits
+    else:
+        if kind == 2:
+            dna = dna.linearize()
+        strands = [dna.top, dna.bottom]
+        paired = (dna.bottom.bits ^ _ones(len(dna))) & ~dna.bottom.gaps
+        sequence = dna.top.bits | (paired & dna.top.gaps)
+    runs = map(_gap_runs, strands)
+    meta = json.dumps(metadata or {})
+    table = json.dumps([list(feature) for feature in features])
+    out.write(_MOLECULE_HEADER.pack(_MOLECULE_MAGIC, _MOLECULE_VERSION, kind,
+                                    len(dna), len(runs[0]),
+                                    len(runs[1]) if kind else 0,
+                                    len(meta), len(table)))
+    out.write(_to_bytes(sequence, len(dna)))
+    for strand_runs in runs:
+        out.write(struct.pack('<%dQ' % (2 * len(strand_runs)),
+                              *itertools.chain(*strand_runs)))
+    out.write(meta)
+    out.write(table)
+
+class Molecule_file(object):
+    """A molecule written by write_molecule, memory-mapped so that reading a
+       region only touches the bytes of that region"""
+    
+    def __init__(self, filename):
+        """String -> Molecule_file"""
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = ""
+        if len(self._map) < _MOLECULE_HEADER.size or \
+                self._map[:4] != _MOLECULE_MAGIC:
+            self.close()
+            raise ValueError("Not a molecule file: " + filename)
+        (_, version, kind, self.length, top_runs, bottom_runs, meta_size,
+         table_size) = _MOLECULE_HEADER.unpack_from(self._map)
+        if version != _MOLECULE_VERSION:
+            self.close()
+            raise ValueError("Unsupported molecule file version %d: %s"
+                             % (version, filename))
+        self.kind = _MOLECULE_KINDS[kind]
+        offset = _MOLECULE_HEADER.size
+        self._bases = buffer(self._map, offset, (self.length + 3) // 4)
+        offset += len(self._bases)
+        self._runs = []
+        for count in [top_runs, bottom_runs][:1 + (kind > 0)]:
+            self._runs.append(np.frombuffer(self._map, '<u8', 2 * count,
+                                            offset).reshape(count, 2))
+            offset += 16 * count
+        self._meta = (offset, offset + meta_size)
+        self._table = (offset + meta_size, offset + meta_size + table_size)
+        self._metadata = None
+        self._features = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Release the memory map and the file.  Molecules already read do
+           not depend on them."""
+        self._bases = self._runs = None
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+    
+    def __len__(self):
+        return self.length
+    
+    @property
+    def metadata(self):
+        """-> Dictionary"""
+        if self._metadata is None:
+            self._metadata = json.loads(self._map[slice(*self._meta)])
+        return self._metadata
+    
+    def features(self, start=0, end=None):
+        """The (start, end, feature) of the feature table overlapping
+           [start, end), by start.  The table is indexed the first time.
+           int int -> List<(int, int, Any)>"""
+        if self._features is None:
+            table = json.loads(self._map[slice(*self._table)])
+            self._features = Interval_index(map(tuple, table))
+        if end is None:
+            end = self.length
+        return self._features.overlapping(start, end)
+    
+    def read(self, start=0, end=None):
+        """The whole molecule, or the bases [start, end) of it as a molecule
+           of the same kind (a Double_strand for a region of a ring, counted
+           from its origin)
+           int int -> Single_strand OR Double_strand OR Circular_strand"""
+        whole = start == 0 and end is None
+        if end is None:
+            end = self.length
+        if not 0 <= start <= end <= self.length:
+            raise IndexError("Region %d-%d outside the molecule" %
+                             (start, end))
+        n = end - start
+        sequence = _extract(self._bases, start, end)
+        strands = []
+        for ind, runs in enumerate(self._runs):
+            gaps = _runs_mask(runs, start, end)
+            bits = sequence if ind == 0 else sequence ^ _ones(n)
+            strands.append(Packed_bases(n, bits & ~gaps, gaps))
+        if self.kind is Single_strand:
+            return Single_strand(strands[0])
+        ds = Double_strand.from_packed(*strands)
+        if self.kind is Circular_strand and whole:
+            return Circular_strand(ds)
+        return ds
+
+def read_molecule(filename):
+    """The whole molecule in a file written by write_molecule
+       String -> Single_strand OR Double_strand OR Circular_strand"""
+    with Molecule_file(filename) as molecule_file:
+        return molecule_file.read()
 
 #Double_strand.random_dna(10000).draw_ladder()
 
@@ -0,0 +1,268 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import numpy as np
+from genes import *
+
+SIZES = [10 ** k for k in range(3, 8)]
+
+def time_call(label, fn, repeat=3):
+    """Print and return the best wall-clock time of fn() over repeat runs
+       String (-> Any) int -> float"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print "\t%-40s %8.4f s" % (label, best)
+    return best
+
+class _Baseline_nucleotide(object):
+    """Nucleotide as it was before interning, kept as the reference for
+       bench_construction: validated and allocated for every base"""
+    
+    base_matches = {'A':'T', 'T':'A', 'C':'G', 'G':'C', '':''}
+    valid_bases = base_matches.keys()
+    
+    def __init__(self, base):
+        base = base.upper()
+        if base in self.valid_bases:
+            self.base = base
+        elif base == " ":
+            self.base = ""
+        else:
+            raise ValueError('Invalid base.  Must be one of A, C, T, G, or " "')
+    
+    def is_complementary(self, base):
+        if base.base == "" or self.base == "":
+            return True
+        return self.base_matches[self.base] == base.base
+    
+    def pair(self):
+        return _Baseline_nucleotide(self.base_matches[self.base])
+
+def _baseline_double_strand(text):
+    """Double_strand(text) as it was before interning: a list of pairs of
+       per-base Nucleotides, the bottom strand made by pair()
+       String -> List<(_Baseline_nucleotide, _Baseline_nucleotide)>"""
+    top = map(_Baseline_nucleotide, text)
+    bottom = map(lambda b: b.pair(), top)
+    if not all(b1.is_complementary(b2) for b1, b2 in zip(top, bottom)):
+        raise ValueError("Input strands are not complementary")
+    return zip(top, bottom)
+
+def bench_construction(n):
+    """Construction from text before interning (per-base Nucleotides) and
+       now (interned lookup, packed strands)"""
+    text = str(Double_strand.random_dna(n).top)
+    print "Construction, %d bases:" % n
+    per_base = time_call("baseline Nucleotide(b) for every base",
+                         lambda: map(_Baseline_nucleotide, text))
+    lookup = time_call("interned table lookup",
+                       lambda: map(Nucleotide._interned.__getitem__, text))
+    print "\t%-40s %8.1fx" % ("Nucleotide speedup", per_base / lookup)
+    baseline = time_call("baseline Double_strand(String)",
+                         lambda: _baseline_double_strand(text))
+    packed = time_call("Double_strand(String)", lambda: Double_strand(text))
+    print "\t%-40s %8.1fx" % ("Double_strand speedup", baseline / packed)
+    bases = map(Nucleotide, text)
+    time_call("Single_strand(List<Nucleotide>)",
+              lambda: Single_strand(bases))
+    time_call("Double_strand(String, String)",
+              lambda: Double_strand(text, str(Packed_bases.from_string(text)
+                                              .reverse_complement())))
+
+# Each operation is a setup function, run untimed, that builds the inputs
+# for n bases, and the timed call on those inputs.
+
+def _molecule(n):
+    return Double_strand.random_dna(n, seed=n)
+
+def _sticky_halves(n):
+    """The two halves of a molecule cut with 4 base sticky ends
+       int -> List<Double_strand>"""
+    half = n // 2
+    return _molecule(n).cut([(half - 2, half + 2)])
+
+def _digest_inputs(n):
+    enzymes = [Restriction_enzyme(map(Nucleotide, site), 1)
+               for site in ['gaattc', 'ggatcc']]
+    return (_molecule(n), Enzyme_panel(enzymes))
+
+OPERATIONS = [
+    ('construct', lambda n: str(_molecule(n).top),
+     lambda text: Double_strand(text)),
+    ('random_dna', lambda n: n,
+     lambda n: Double_strand.random_dna(n, seed=0)),
+    ('split', _molecule, lambda ds: ds.split(len(ds) // 3)),
+    ('anneal', _molecule, lambda ds: ds.anneal()),
+    ('rotate', _molecule, lambda ds: ds.rotate()),
+    ('overhang_5', lambda n: _sticky_halves(n)[1],
+     lambda ds: ds.overhang_5()),
+    ('overhang_3', lambda n: _sticky_halves(n)[0],
+     lambda ds: ds.overhang_3()),
+    ('ligate', _sticky_halves, lambda halves: halves[0].ligate(halves[1])),
+    ('is_complementary', lambda n: _molecule(n).anneal(),
+     lambda strands: strands[0].is_complementary(strands[1])),
+    ('restrict', _digest_inputs, lambda inputs: inputs[0].restrict(inputs[1])),
+]
+
+def _peak_kb():
+    """High-water mark of this process's resident memory, in KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, OS X reports bytes
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+def _reset_peak():
+    """Lower the high-water mark to the current resident memory, so the
+       setup's own peak is not counted.  Only Linux supports this;
+       elsewhere the setup's peak stays and growth beyond it is measured."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+def _measure(setup, run, n, repeat, results):
+    """Child process body: build the inputs, then time run and record how
+       far the memory high-water mark rose above the setup's"""
+    try:
+        inputs = setup(n)
+        _reset_peak()
+        before = _peak_kb()
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            run(inputs)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        results.put((best, _peak_kb() - before))
+    except Exception as e:
+        # Report the failure so the parent does not wait forever
+        results.put(e)
+
+def measure(setup, run, n, repeat=3):
+    """Best time and peak memory growth (KB) of run(setup(n)).  Runs in a
+       fresh process so one measurement's memory cannot hide another's.
+       (int -> Any) (Any -> Any) int int -> (float, int)"""
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_measure,
+                                    args=(setup, run, n, repeat, results))
+    child.start()
+    measured = results.get()
+    child.join()
+    if isinstance(measured, Exception):
+        raise measured
+    return measured
+
+def scaling_exponent(sizes, seconds):
+    """Least-squares slope of log(time) against log(size): about 1 for
+       linear operations, 0 for constant time
+       List<int> List<float> -> float OR None"""
+    points = [(n, t) for n, t in zip(sizes, seconds) if t > 0]
+    if len(points) < 2:
+        return None
+    sizes, seconds = zip(*points)
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+def run_suite(sizes=SIZES, operations=None, repeat=3):
+    """Measure every operation at every size, printing as it goes
+       List<int> List<String> int -> Dictionary"""
+    results = []
+    exponents = {}
+    for name, setup, run in OPERATIONS:
+        if operations and name not in operations:
+            continue
+        print "%s:" % name
+        seconds = []
+        for n in sizes:
+            best, peak = measure(setup, run, n, repeat)
+            rate = n / best if best > 0 else float('inf')
+            print "\t%10d bases %10.4f s %14.0f bases/s %10d KB" % \
+                (n, best, rate, peak)
+            results.append({'operation': name, 'bases': n, 'seconds': best,
+                            'bases_per_second': rate if best > 0 else None,
+                            'peak_kb': peak})
+            seconds.append(best)
+        exponents[name] = scaling_exponent(sizes, seconds)
+        if exponents[name] is not None:
+            print "\t%-16s %6.2f" % ("scaling exponent", exponents[name])
+    return {'python': platform.python_version(),
+            'machine': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'results': results,
+            'exponents': exponents}
+
+def compare(old, new, threshold=1.2):
+    """Print the time ratio new/old of every measurement in both runs and
+       return the ones slower by more than threshold
+       Dictionary Dictionary float -> List<(String, int, float)>"""
+    old_times = dict(((r['operation'], r['bases']), r['seconds'])
+                     for r in old['results'])
+    regressions = []
+    for r in new['results']:
+        key = (r['operation'], r['bases'])
+        if key not in old_times:
+            continue
+        before, after = old_times[key], r['seconds']
+        # Runs too short to time reliably are not compared
+        if min(before, after) < 1e-4:
+            ratio = 1.0
+        else:
+            ratio = after / before
+        flag = ""
+        if ratio > threshold:
+            flag = "REGRESSION"
+            regressions.append((key[0], key[1], ratio))
+        elif ratio < 1.0 / threshold:
+            flag = "faster"
+        print "%-16s %10d %10.4f s %10.4f s %7.2fx %s" % \
+            (key[0], key[1], before, after, ratio, flag)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the genetics API across sequence sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help="sequence sizes in bases (default 10^3..10^7)")
+    parser.add_argument('--ops', nargs='+',
+                        choices=[name for name, _, _ in OPERATIONS],
+                        help="only run these operations")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per measurement; the best is kept")
+    parser.add_argument('--out', help="save the results to this JSON file")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two saved runs instead of running")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="slowdown ratio counted as a regression")
+    parser.add_argument('--construction', action='store_true',
+                        help="time Nucleotide interning on 1 Mbp instead")
+    args = parser.parse_args()
+    if args.construction:
+        bench_construction(10 ** 6)
+    elif args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        print "%d regression(s)" % len(regressions)
+        sys.exit(1 if regressions else 0)
+    else:
+        report = run_suite(sorted(args.sizes), args.ops, args.repeat)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import os
+import pickle
+import StringIO
+import tempfile
 import unittest
 from genes import *
 
@@ -9,6 +13,8 @@ n = Nucleotide("")
 
 enz_a_t = Restriction_enzyme([a,t], 1)
 enz__at = Restriction_enzyme([a,t], 0)
+enz_ac_g = Restriction_enzyme([a,c], 1)
+ecori = Restriction_enzyme(map(Nucleotide, 'gaattc'), 1)
 
 class _tests(unittest.TestCase):
     
@@ -19,6 +25,8 @@ class _tests(unittest.TestCase):
         self.assertEqual(find_sub_list([a,t],[c,a,t]), 1)
         self.assertEqual(find_sub_list([a,t],[c,c,c,a,t]), 3)
         self.assertEqual(find_sub_list([a,t],[a,t,c,c,c,a,t]), 0)
+        self.assertEqual(find_sub_list([a,t],[a,c,c,a,t]), 3)
+        self.assertFalse(find_sub_list([a,t],[a,c,c,a]))
 
 class Nucleotide_tests(unittest.TestCase):
     
@@ -29,6 +37,14 @@ class Nucleotide_tests(unittest.TestCase):
         self.assertTrue(n.is_complementary(t))
         self.assertTrue(a.is_complementary(n))
         
+    def test_interned(self):
+        self.assertIs(Nucleotide("a"), a)
+        self.assertIs(Nucleotide(" "), n)
+        self.assertIs(a.pair(), t)
+        self.assertIs(pickle.loads(pickle.dumps(g)), g)
+        self.assertRaises(ValueError, Nucleotide, "x")
+        self.assertEqual(len(set([a, c, g, t, n, Nucleotide("A")])), 5)
+        
     def test_is_empty(self):
         self.assertFalse(a.is_empty())
         self.assertTrue(n.is_empty())
@@ -41,6 +57,93 @@ class Nucleotide_tests(unittest.TestCase):
         self.assertNotEqual(n.pair(), t)
         self.assertNotEqual(a.pair(), g)
         
+class Packed_bases_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.actg = Packed_bases.from_string('actg')
+        self.nnacg = Packed_bases.from_string('  acg')
+
+    def test_from_string(self):
+        self.assertEqual(str(self.actg), 'ACTG')
+        self.assertEqual(str(self.nnacg), '  ACG')
+        self.assertEqual(len(self.nnacg), 5)
+        self.assertEqual(Packed_bases.from_string(''), Packed_bases())
+        self.assertRaises(ValueError, Packed_bases.from_string, 'acxg')
+
+    def test_slice(self):
+        self.assertEqual(self.actg[1:3], Packed_bases.from_string('ct'))
+        self.assertEqual(self.nnacg[0:3], Packed_bases.from_string('  a'))
+        self.assertEqual(self.actg[2:2], Packed_bases())
+        self.assertEqual(self.actg[3], g)
+        self.assertEqual(self.nnacg[1], n)
+        # Slices past the end stop there, even on views and ropes
+        view = Packed_bases.from_string('acgtacgtac').slice(2, 8)
+        self.assertEqual(str(view.slice(0, 9)), 'GTACGT')
+        self.assertEqual(str(view.slice(7, 9)), '')
+        rope = Packed_bases._rope([self.actg, self.nnacg])
+        self.assertEqual(str(rope.slice(6, 20)), 'ACG')
+        self.assertEqual(str(rope.slice(-3, 2)), 'AC')
+
+    def test_add(self):
+        self.assertEqual(self.nnacg + self.actg,
+                         Packed_bases.from_string('  acgactg'))
+
+    def test_reverse_complement(self):
+        self.assertEqual(str(self.nnacg.reverse()), 'GCA  ')
+        self.assertEqual(str(self.nnacg.complement()), '  TGC')
+        self.assertEqual(str(self.actg.reverse_complement()), 'CAGT')
+        long_bases = Packed_bases.from_string('acgtt' * 7)
+        self.assertEqual(long_bases.reverse().reverse(), long_bases)
+
+    def test_views(self):
+        bases = Packed_bases.from_string('  acgtaac ')
+        view = bases.reverse()[1:7].complement()[2:5]
+        self.assertEqual(str(view), 'TAC')
+        self.assertEqual(view, Packed_bases.from_string('tac'))
+        self.assertEqual(str(bases[3:8].reverse_complement()), 'TTACG')
+        self.assertEqual(str(bases[0:0].reverse()), '')
+        
+    def test_pairs_with(self):
+        self.assertTrue(self.actg.pairs_with(self.actg.complement()))
+        self.assertTrue(self.nnacg.pairs_with(Packed_bases.from_string('cgtg ')))
+        self.assertFalse(self.actg.pairs_with(self.actg))
+        self.assertFalse(self.actg.pairs_with(self.nnacg))
+
+    def test_remove_empties(self):
+        self.assertEqual(self.nnacg.remove_empties(),
+                         Packed_bases.from_string('acg'))
+
+class Enzyme_panel_tests(unittest.TestCase):
+    
+    def test_find_sites(self):
+        panel = Enzyme_panel([ecori, enz_ac_g])
+        self.assertEqual(panel.find_sites('acgaattcac'), \
+            [(0, enz_ac_g, True), (2, ecori, True), (8, enz_ac_g, True)])
+        self.assertEqual(panel.find_sites('gtacgt'), \
+            [(0, enz_ac_g, False), (2, enz_ac_g, True), (4, enz_ac_g, False)])
+        self.assertEqual(panel.find_sites('gtacgt', False), \
+            [(2, enz_ac_g, True)])
+        self.assertEqual(panel.find_sites('gaat tc'), [])
+        
+    def test_cut_sites(self):
+        panel = Enzyme_panel([ecori, enz_ac_g])
+        self.assertEqual(panel.cut_sites(Double_strand('aagaattcaa')), \
+            [(3, 7)])
+        self.assertEqual(panel.cut_sites(Double_strand('ggtcc')), [(2, 2)])
+        self.assertEqual(panel.cut_sites(Double_strand('gaattc', ' aattc')), [])
+        
+    def test_overlapping_cuts(self):
+        # CCNGG matches CCCGGG twice, at 0 and 1, on opposite strands
+        panel = Enzyme_panel([Restriction_enzyme('CCNGG', 1)])
+        dna = Double_strand('aacccgggaa')
+        self.assertEqual(panel.cut_sites(dna), [(3, 6), (4, 7)])
+        fragments = panel.digest(dna)
+        self.assertEqual(fragments, dna.cut([(3, 6), (4, 7)]))
+        self.assertEqual(len(fragments), 2)
+        self.assertEqual([(str(f.top), str(f.bottom)) for f in fragments], \
+            [('AAC   ', 'TTGGGC'), ('CGGGAA', '   CTT')])
+        self.assertEqual(len(dna.cut([(3, 6), (5, 8)])), 2)
+        
 class Single_strand_tests(unittest.TestCase):
 
     def setUp(self):
@@ -62,6 +165,8 @@ class Single_strand_tests(unittest.TestCase):
         self.assertEqual(self.actg.split(4), [self.actg, Single_strand('')])
         self.assertEqual(self.actg.split(2), \
             [Single_strand('ac'), Single_strand('tg')])
+        self.assertEqual(Single_strand('acg').split(5), \
+            [Single_strand('acg'), Single_strand('')])
     
     def test_reverse_strand(self):
         self.assertEqual(self.ca.reverse_strand(), self.ac)
@@ -75,12 +180,67 @@ class Single_strand_tests(unittest.TestCase):
         self.assertFalse(self.actg.is_complementary(self.gtca))
         self.assertFalse(self.actg.is_complementary(self.tgac))
         
+    def test_first_mismatch(self):
+        self.assertEqual(self.actg.first_mismatch(self.cagt), -1)
+        self.assertEqual(self.actg.first_mismatch(self.tgac), 0)
+        self.assertEqual(self.actg.first_mismatch(Single_strand('gcgt')), 2)
+        self.assertEqual(self.nnac.first_mismatch(Single_strand('ttaa')), 3)
+        self.assertEqual(self.actg.first_mismatch(Single_strand('agt')), 3)
+        
+    def test_batch(self):
+        pairs = [(self.actg, self.cagt), (self.actg, self.tgac), \
+                 (self.nnac, Single_strand('ttaa')), (self.actg, self.ca), \
+                 (Single_strand(''), Single_strand(''))]
+        self.assertEqual(first_mismatch_batch(pairs), [-1, 0, 3, 0, -1])
+        self.assertEqual(complementary_batch(pairs), \
+            [p[0].is_complementary(p[1]) for p in pairs])
+        
     def test_is_palindromic(self):
         self.assertFalse(self.actg.is_palindromic())
         self.assertFalse(Single_strand('aat').is_palindromic())
         self.assertTrue(Single_strand('aatt').is_palindromic())
         self.assertFalse(self.nnac.is_palindromic())
         
+    def test_find_palindromes(self):
+        starts, lengths = Single_strand('cgaattcaatt').find_palindromes()
+        self.assertEqual(zip(starts, lengths), [(1, 6), (7, 4)])
+        starts, lengths = find_palindromes('cgaattcaat', 2, 4)
+        self.assertEqual(zip(starts, lengths), [(0, 2), (2, 4), (8, 2)])
+        starts, lengths = Double_strand('gaattc', 'gaatt ').find_palindromes()
+        self.assertEqual(zip(starts, lengths), [(1, 4)])
+        self.assertEqual(len(find_palindromes('')[0]), 0)
+
+    def test_approximate_matches(self):
+        self.assertEqual(approximate_matches('gaattc', 'ccgaattcgg'), \
+            [(2, 8, 0)])
+        self.assertEqual(approximate_matches('gaattc', 'ccgaatcgg', 1), \
+            [(2, 7, 1)])
+        self.assertEqual(approximate_matches('gaattc', 'ccgaatcgg', 1, False), \
+            [])
+        self.assertEqual(approximate_matches('gaattc', 'ccgatttcgg', 1, False), \
+            [(2, 8, 1)])
+        self.assertEqual(approximate_matches('gaattc', 'gaa ttc'), [])
+
+    def test_approximate_repeats(self):
+        self.assertEqual(approximate_matches('aaaa', 'aaaaa'), \
+            [(0, 4, 0), (1, 5, 0)])
+        self.assertEqual(approximate_matches('aaaa', 'aaaaa', 1), \
+            approximate_matches('aaaa', 'aaaaa', 1, False))
+        self.assertEqual(approximate_matches('acgacg', 'acgacgacgacg', 1), \
+            [(0, 6, 0), (3, 9, 0), (6, 12, 0)])
+        self.assertEqual(approximate_matches('acgacg', 'acgagacgacg', 1), \
+            [(0, 5, 1), (5, 11, 0)])
+        self.assertEqual(Single_strand('tttttt').find_binding('aaaa'), \
+            [(0, 4, 0), (1, 5, 0), (2, 6, 0)])
+
+    def test_find_binding(self):
+        strand = Single_strand('ttgaattcaacgtt')
+        self.assertEqual(strand.find_binding('gttga'), [(6, 11, 0)])
+        self.assertEqual(strand.find_binding('gtaga', 1, False), \
+            [(6, 11, 1)])
+        self.assertEqual(Double_strand('ttgaattcaacgtt').find_binding( \
+            'caacg', 1), [(7, 12, 0, False), (10, 14, 1, True)])
+        
     def test_remove_empties(self):
         self.assertEqual(self.actg.remove_empties(), self.actg)
         self.assertEqual(self.nnac.remove_empties(), self.ac)
@@ -97,10 +257,12 @@ class Single_strand_tests(unittest.TestCase):
             [Single_strand('ca'), Single_strand('t')])
         self.assertEqual(self.at.restrict(enz_a_t), \
             [Single_strand('a'), Single_strand('t')])
-        #self.assertEqual(self.at.restrict(enz__at), [self.at])
+        self.assertEqual(self.at.restrict(enz__at), [self.at])
         self.assertEqual(self.atat.restrict(enz_a_t), \
             [Single_strand('a'), Single_strand('ta'), Single_strand('t')])
-        #self.assertEqual(self.atat.restrict(enz__at), [self.at, self.at])
+        self.assertEqual(self.atat.restrict(enz__at), [self.at, self.at])
+        self.assertEqual(self.actgac.restrict([enz_a_t, enz_ac_g]), \
+            [Single_strand('a'), Single_strand('ctga'), Single_strand('c')])
         
     
 class Double_strand_test(unittest.TestCase):
@@ -118,6 +280,32 @@ class Double_strand_test(unittest.TestCase):
         self.assertEqual(self.actg.split(4), [self.actg, Double_strand('')])
         self.assertEqual(self.actg.split(2), \
             [Double_strand('ac'), Double_strand('tg')])
+        self.assertEqual(Double_strand('acg').split(5), \
+            [Double_strand('acg'), Double_strand('')])
+        
+    def test_base_pairs(self):
+        self.assertEqual(self.ca.base_pairs, [(c, g), (a, t)])
+        self.assertEqual(self.na_tt.base_pairs, [(n, t), (a, t)])
+        self.assertEqual(Double_strand(self.na_tt.base_pairs), self.na_tt)
+    
+    def test_random_dna(self):
+        dna = Double_strand.random_dna(1000)
+        self.assertEqual(len(dna), 1000)
+        self.assertEqual(dna, Double_strand(dna.strand53()))
+        self.assertEqual(Double_strand.random_dna(100, seed=1), \
+            Double_strand.random_dna(100, seed=1))
+        self.assertEqual(Double_strand.random_dna(0), Double_strand(''))
+        self.assertEqual(Double_strand.random_dna(50, 0, seed=1).top, \
+            Double_strand.random_dna(50, 0, seed=1).top.remove_empties())
+        at_only = str(Double_strand.random_dna(200, 0).top)
+        self.assertEqual(at_only.count('C') + at_only.count('G'), 0)
+        self.assertRaises(ValueError, Double_strand.random_dna, 10, 1.5)
+    
+    def test_random_bases(self):
+        blocks = list(random_bases(70000, 0.5, 'seed'))
+        self.assertEqual(map(len, blocks), [65536, 4464])
+        self.assertEqual(Packed_bases.from_string("".join(blocks)), \
+            Double_strand.random_dna(70000, 0.5, 'seed').top)
     
     def test_strand53(self):
         self.assertEqual(self.actg.strand53(), Single_strand('actg'))
@@ -158,6 +346,26 @@ class Double_strand_test(unittest.TestCase):
         self.assertEqual(self.cca_ngg.overhang_3(),
              [Double_strand('cc'), Double_strand('a',' ')])
     
+    def test_ligate_repeated(self):
+        pieces = Double_strand('aagaattcaagg' * 500).restrict(ecori)
+        whole = pieces[0]
+        for piece in pieces[1:]:
+            whole = whole.ligate(piece)
+        self.assertEqual(whole, Double_strand('aagaattcaagg' * 500))
+        self.assertEqual(whole.overhang_3(), [whole, Double_strand('')])
+        
+    def test_restrict(self):
+        dna = Double_strand('aagaattcaa')
+        pieces = [Double_strand('aag    ', 'aattctt'), \
+                  Double_strand('aattcaa', 'ttg    ')]
+        self.assertEqual(dna.restrict(ecori), pieces)
+        self.assertEqual(pieces[0].ligate(pieces[1]), dna)
+        self.assertEqual(self.actg.restrict(ecori), [self.actg])
+        self.assertEqual(Double_strand('gaattcgaattc').restrict([ecori]), \
+            [Double_strand('g    ', 'aattc'), \
+             Double_strand('aattcg    ', 'aattcg    '), \
+             Double_strand('aattc', 'g    ')])
+    
     def test_ligate(self):
         self.assertFalse(self.actg.ligate(self.ca_nn))
         self.assertFalse(self.ca_nn.ligate(self.na_tt))
@@ -167,10 +375,463 @@ class Double_strand_test(unittest.TestCase):
         atn_cat = Double_strand(Single_strand([a,t,n]), 'cat')
         gcc_ggn = Double_strand('gcc', 'gg ')
         self.assertEqual(atn_cat.ligate(gcc_ggn), Double_strand('atgcc'))
-    
+
+    def test_draw_ladder(self):
+        out = StringIO.StringIO()
+        self.ca_nn.draw_ladder(out)
+        self.assertEqual(out.getvalue(),
+                         "\n\t|     \n\tC--   \n\t|     \n\tA--   \n\t|     \n")
+        out = StringIO.StringIO()
+        self.actg.draw_ladder(out, center=2, radius=1)
+        self.assertEqual(out.getvalue(),
+                         "\n\t|    |\n\tC----G\n\t|    |\n\tT----A\n\t|    |\n")
+        out = StringIO.StringIO()
+        self.actg.draw_ladder(out, start=4)
+        self.assertEqual(out.getvalue(), "\n")
+
+    def test_draw_overview(self):
+        out = StringIO.StringIO()
+        Double_strand('acgtac', 'gtacg ').draw_overview(out, 3, [2])
+        self.assertEqual(out.getvalue(),
+                         "\t===\n\t-==\n\t ^\n\t0 6\n")
+
     Double_strand(Single_strand([n,n,n,c,a,t,g,a,t,a,a]), \
                   Single_strand([n,n,a,t,c,a,t,g,t,t,a])).draw_ladder()
         
+class Sequence_file_tests(unittest.TestCase):
+    
+    def write_file(self, text):
+        fd, filename = tempfile.mkstemp()
+        os.write(fd, text)
+        os.close(fd)
+        self.addCleanup(os.remove, filename)
+        return filename
+    
+    def test_fasta(self):
+        filename = self.write_file(">one first\nACGTN\nacg\n\n>two\nGG\nCC\n")
+        self.assertEqual(list(read_sequences(filename)), \
+            [('one first', Double_strand('acgt acg')), \
+             ('two', Double_strand('ggcc'))])
+    
+    def test_fastq(self):
+        filename = self.write_file("@r1\nACGT\n+\n@@@@\n@r2\nNac\n+r2\nIII\n")
+        self.assertEqual(list(read_sequences(filename)), \
+            [('r1', Double_strand('acgt')), ('r2', Double_strand(' ac'))])
+    
+    def test_chunked_records(self):
+        filename = self.write_file(">one\nACGTA\nCG\n>two\nG\r\nNC\n")
+        with Sequence_file(filename) as seq_file:
+            seq_file.chunk_size = 2
+            self.assertEqual(list(seq_file.records()), \
+                [('one', Double_strand('acgtacg')), \
+                 ('two', Double_strand('g c'))])
+    
+    def test_windows(self):
+        filename = self.write_file(">one\nACGTA\nCG\n>two\nGGCC\n")
+        with Sequence_file(filename) as seq_file:
+            seq_file.chunk_size = 3
+            self.assertEqual(list(seq_file.windows(3)), \
+                [('one', 0, Double_strand('acg')), \
+                 ('one', 3, Double_strand('tac')), \
+                 ('one', 6, Double_strand('g')), \
+                 ('two', 0, Double_strand('ggc')), \
+                 ('two', 3, Double_strand('c'))])
+            self.assertEqual([w[1] for w in seq_file.windows(3, 2)], \
+                [0, 2, 4, 0, 2])
+            self.assertEqual([w[1] for w in seq_file.windows(2, 3)], \
+                [0, 3, 6, 0, 3])
+        
+    def test_write_fasta(self):
+        out = StringIO.StringIO()
+        write_fasta(out, 'r', ['acg', 'tac', 'gt'], 3)
+        self.assertEqual(out.getvalue(), ">r\nacg\ntac\ngt\n")
+        filename = self.write_file(out.getvalue())
+        self.assertEqual(list(read_sequences(filename)), \
+            [('r', Double_strand('acgtacgt'))])
+        
+    def test_empty(self):
+        self.assertEqual(list(read_sequences(self.write_file(""))), [])
+        self.assertRaises(ValueError, Sequence_file, self.write_file("ACGT"))
+        
+class Molecule_file_tests(unittest.TestCase):
+    
+    def setUp(self):
+        self.sticky = Double_strand('  aattcaag', '  tgaattcg')
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.filename)
+    
+    def write(self, dna, metadata=None, features=()):
+        with open(self.filename, 'wb') as out:
+            write_molecule(out, dna, metadata, features)
+    
+    def test_round_trip(self):
+        ring = Circular_strand(Double_strand('acgttgca')).rotate_origin(3)
+        for dna in [self.sticky, ring, Single_strand('ac gt'),
+                    Double_strand('')]:
+            self.write(dna)
+            self.assertEqual(read_molecule(self.filename), dna)
+        self.assertEqual(pickle.loads(pickle.dumps(self.sticky, 2)), \
+            self.sticky)
+        self.assertEqual(pickle.loads(pickle.dumps(self.sticky.top[1:4])), \
+            Packed_bases.from_string(' aa'))
+    
+    def test_regions(self):
+        self.write(self.sticky, {'name': 'insert'}, \
+                   [(2, 8, 'EcoRI'), (0, 2, 'overhang')])
+        with Molecule_file(self.filename) as molecule_file:
+            self.assertEqual(len(molecule_file), 10)
+            self.assertIs(molecule_file.kind, Double_strand)
+            self.assertEqual(molecule_file.metadata, {'name': 'insert'})
+            self.assertEqual(molecule_file.features(7, 9), \
+                [(2, 8, 'EcoRI')])
+            self.assertEqual(molecule_file.read(1, 4), \
+                Double_strand(' aa', 'ttc'))
+            self.assertEqual(molecule_file.read(8, 10), \
+                Double_strand('ag', '  '))
+            self.assertRaises(IndexError, molecule_file.read, 5, 11)
+        self.assertRaises(ValueError, Molecule_file, __file__)
+        
+class Circular_strand_tests(unittest.TestCase):
+    
+    def setUp(self):
+        # The EcoRI site runs across the origin
+        self.ring = Circular_strand('ttcaaaaaagaa')
+        self.opened = Double_strand('aattcaaaaaag    ', 'aattcttttttg    ')
+        
+    def test_rotate_origin(self):
+        self.assertEqual(self.ring.rotate_origin(3).linearize(), \
+            Double_strand('aaaaaagaattc'))
+        self.assertEqual(self.ring.rotate_origin(15), self.ring.rotate_origin(3))
+        self.assertEqual(self.ring.rotate_origin(12), self.ring)
+        self.assertNotEqual(self.ring.rotate_origin(1), self.ring)
+        
+    def test_rotate(self):
+        self.assertEqual(self.ring.rotate().linearize(), \
+            Double_strand('ttcttttttgaa'))
+        self.assertEqual(self.ring.rotate_origin(5).rotate().rotate(), \
+            self.ring.rotate_origin(5))
+        
+    def test_restrict(self):
+        self.assertEqual(self.ring.find_sites(ecori), [(9, ecori, True)])
+        self.assertEqual(self.ring.cut_sites(ecori), [(10, 14)])
+        self.assertEqual(self.ring.restrict(ecori), [self.opened])
+        self.assertEqual(self.ring.rotate_origin(7).restrict(ecori), \
+            [self.opened])
+        self.assertEqual(self.ring.restrict(enz_ac_g), [self.ring])
+        
+    def test_self_ligate(self):
+        self.assertEqual(self.opened.self_ligate().rotate_origin(10), \
+            self.ring)
+        self.assertEqual(Double_strand('acg').self_ligate(), \
+            Circular_strand('acg'))
+        self.assertFalse(Double_strand('acgt', ' cgt').self_ligate())
+        self.assertRaises(ValueError, Circular_strand, 'ac ')
+        
+class Fragment_pool_tests(unittest.TestCase):
+    
+    def setUp(self):
+        self.pieces = Double_strand('ccgaattcaaagaattcgg').restrict(ecori)
+        self.pool = Fragment_pool(self.pieces)
+        
+    def test_compatible_pairs(self):
+        # Sticky ends join in either orientation of the middle piece and the
+        # blunt ends of the two outer pieces join each other
+        self.assertEqual(sorted(self.pool.compatible_pairs()), \
+            [(0, False, 1, False), (0, False, 1, True), \
+             (0, False, 2, False), (0, True, 2, True), \
+             (1, False, 2, False), (1, True, 2, False)])
+        
+    def test_ligations(self):
+        products = list(self.pool.ligations())
+        self.assertEqual(len(products), 6)
+        self.assertTrue(Double_strand('ccgaattcaaag    ', 'aattctttgaattcgg') \
+            in products)
+        self.assertFalse(False in products)
+        
+    def test_blunt(self):
+        pool = Fragment_pool([Double_strand('ac'), Double_strand('ca')])
+        self.assertEqual(len(pool.compatible_pairs()), 4)
+        
+class Population_tests(unittest.TestCase):
+    
+    def setUp(self):
+        self.ancestor = Double_strand.random_dna(500, seed=1)
+        
+    def test_deterministic(self):
+        serial = Population(self.ancestor, 10, 1e-3, 1e-4, 1e-4, seed=2)
+        parallel = Population(self.ancestor, 10, 1e-3, 1e-4, 1e-4, seed=2)
+        serial.simulate(20, processes=1).simulate(20, processes=1)
+        parallel.block_size = 3
+        parallel.simulate(20, processes=2).simulate(20, processes=2)
+        self.assertEqual(serial.mutations, parallel.mutations)
+        self.assertEqual(serial.lengths, parallel.lengths)
+        self.assertEqual(serial.generations, 40)
+        
+    def test_lineage(self):
+        population = Population(self.ancestor, 5, insertion=1e-3, \
+            deletion=1e-3, seed=3).simulate(50, processes=1)
+        for ind in range(len(population)):
+            self.assertEqual(len(population.lineage(ind)), \
+                             population.lengths[ind])
+        substituted = Population(self.ancestor, 1, substitution=1e-3, \
+            seed=4).simulate(10, processes=1)
+        changed = set([m[2] for m in substituted.mutations[0]])
+        ancestor = str(self.ancestor.top)
+        lineage = str(substituted.lineage(0).top)
+        differences = [i for i in range(500) if ancestor[i] != lineage[i]]
+        self.assertTrue(set(differences) <= changed)
+        self.assertEqual(Population(self.ancestor, 2).simulate(10, 1) \
+            .lineage(1), self.ancestor)
+        
+    def test_sticky_ancestor(self):
+        self.assertRaises(ValueError, Population, Double_strand(' a', 'tt'), 1)
+        
+class Fragment_size_tests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dna = Double_strand('aagaattcaacccgaattcggggg')
+        
+    def test_fragment_sizes(self):
+        cuts = Enzyme_panel(ecori).cut_sites(self.dna)
+        self.assertEqual(fragment_sizes(cuts, len(self.dna)).tolist(), \
+            map(len, self.dna.restrict(ecori)))
+        self.assertEqual(fragment_sizes([], 10).tolist(), [10])
+        ring = Circular_strand(self.dna)
+        self.assertEqual(fragment_sizes(ring.cut_sites(ecori), 24, True) \
+            .tolist(), map(len, ring.restrict(ecori)))
+        self.assertEqual(fragment_sizes([], 24, True).tolist(), [24])
+        
+    def test_panel_fragment_sizes(self):
+        panels = [[ecori], [enz_ac_g], [ecori, enz_ac_g], []]
+        sizes = panel_fragment_sizes(self.dna, panels)
+        self.assertEqual([s.tolist() for s in sizes], \
+            [map(len, self.dna.restrict(p)) for p in panels])
+        
+    def test_overlapping_fragment_sizes(self):
+        # CCNGG cuts CCCGGG twice, with nothing paired between the cuts
+        ccngg = Restriction_enzyme('CCNGG', 1)
+        dna = Double_strand('aacccgggaa')
+        self.assertEqual(fragment_sizes(Enzyme_panel(ccngg).cut_sites(dna), \
+            len(dna)).tolist(), [len(f) for f in dna.restrict(ccngg)])
+        self.assertEqual(panel_fragment_sizes(dna, [[ccngg]])[0].tolist(), \
+            [6, 6])
+        ring = Circular_strand(Double_strand('aacccgggaaaa'))
+        self.assertEqual(fragment_sizes(ring.cut_sites(ccngg), 12, True) \
+            .tolist(), [len(f) for f in ring.restrict(ccngg)])
+        self.assertEqual(panel_fragment_sizes(ring, [[ccngg]])[0].tolist(), \
+            [len(f) for f in ring.restrict(ccngg)])
+        
+    def test_virtual_gel(self):
+        gel = Virtual_gel(1, 1000, 3)
+        lanes = gel.lanes([[5, 500, 2000], [5, 5], []], by_mass=False)
+        self.assertEqual(lanes.tolist(), [[2, 0, 1], [0, 0, 2], [0, 0, 0]])
+        self.assertEqual(gel.lane([5, 5]).tolist(), [0, 0, 10])
+        distances = Virtual_gel.distances(lanes)
+        self.assertEqual(distances[1, 1], 0)
+        self.assertAlmostEqual(distances[0, 1], 4.0 / 3)
+
+class Reaction_cache_tests(unittest.TestCase):
+
+    def test_content_hash(self):
+        dna = Double_strand('aagaattcaa')
+        joined = Double_strand.from_packed(dna.top.slice(0, 3) + \
+            dna.top.slice(3, 10), dna.bottom)
+        self.assertEqual(hash(dna), hash(joined))
+        self.assertNotEqual(dna.content_hash(), \
+            Double_strand('aagaattcat').content_hash())
+        self.assertEqual(hash(Packed_bases.from_string('ac ').complement()), \
+            hash(Packed_bases.from_string('tg ')))
+        self.assertEqual(hash(Restriction_enzyme(map(Nucleotide, 'gaattc'), 1)), \
+            hash(ecori))
+        self.assertNotEqual(ecori.content_hash(), \
+            Restriction_enzyme(map(Nucleotide, 'gaattc'), 2).content_hash())
+
+    def test_restrict_ligate(self):
+        cache = Reaction_cache(2)
+        dna = Double_strand('aagaattcaa')
+        fragments = cache.restrict(dna, ecori)
+        self.assertEqual(fragments, dna.restrict(ecori))
+        self.assertEqual(cache.restrict(Double_strand('aagaattcaa'), \
+            [ecori, ecori]), fragments)
+        self.assertEqual(cache.ligate(*fragments), dna)
+        self.assertEqual(cache.ligate(*fragments), dna)
+        self.assertEqual(cache.stats()['hits'], 2)
+        cache.restrict(dna, enz_ac_g)
+        self.assertEqual(len(cache), 2)
+        cache.restrict(dna, ecori)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        cache.clear()
+        self.assertEqual(cache.stats()['hit_rate'], 0.0)
+
+    def test_block_swaps(self):
+        # Blocks of 61 bases (and short sequences) collided in base 4
+        block1, block2 = 'acgtt' * 12 + 'a', 'ttgca' * 12 + 'c'
+        self.assertNotEqual(Double_strand(block1 + block2).content_hash(), \
+            Double_strand(block2 + block1).content_hash())
+        self.assertNotEqual(Double_strand('a' * 31).content_hash(), \
+            Double_strand('c' + 't' * 30).content_hash())
+        # Slices and digest fragments of a hashed molecule hash as if packed
+        dna = Double_strand(block1 * 5 + 'gaattc' + block2 * 5)
+        hash(dna)
+        self.assertEqual(hash(dna.top.slice(7, 500)), \
+            hash(Packed_bases.from_string(str(dna.top)[7:500])))
+        for fragment in dna.restrict(ecori):
+            self.assertTrue(fragment.top._residues is not None)
+            self.assertEqual(hash(fragment), hash(Double_strand.from_packed(
+                Packed_bases.from_string(str(fragment.top)),
+                Packed_bases.from_string(str(fragment.bottom)))))
+
+    def test_unequal_molecules(self):
+        cache = Reaction_cache()
+        dna1 = Double_strand('a' * 31)
+        dna2 = Double_strand('c' + 't' * 30)
+        self.assertTrue(dna1 != dna2)
+        self.assertFalse(dna1 != Double_strand('a' * 31))
+        self.assertFalse(Single_strand('ac') != Single_strand('ac'))
+        cut = Restriction_enzyme([a], 1)
+        self.assertEqual(cache.restrict(dna1, cut), dna1.restrict(cut))
+        self.assertEqual(cache.restrict(dna2, cut), dna2.restrict(cut))
+        self.assertEqual(len(cache.ligate(dna1, dna2)), 62)
+        self.assertEqual(str(cache.ligate(dna2, dna1).top)[:2], 'CT')
+        self.assertEqual(cache.misses, 4)
+
+class Interval_index_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = Interval_index([(10, 20, 'b'), (0, 5, 'a'), (15, 40, 'c')])
+
+    def test_overlapping(self):
+        self.assertEqual(self.index.overlapping(4, 12), \
+            [(0, 5, 'a'), (10, 20, 'b')])
+        self.assertEqual(self.index.overlapping(20, 21), [(15, 40, 'c')])
+        self.assertEqual(self.index.overlapping(5, 10), [])
+        self.index.add(6, 7, 'd')
+        self.assertEqual(self.index.overlapping(5, 10), [(6, 7, 'd')])
+        self.index.remove(10, 20, 'b')
+        self.assertEqual(len(self.index), 3)
+        self.assertRaises(ValueError, self.index.remove, 10, 20, 'b')
+        self.assertRaises(ValueError, self.index.add, 3, 3, 'e')
+
+    def test_split_join(self):
+        left, right = self.index.split(18)
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(list(left), [(0, 5, 'a'), (10, 18, 'b'), (15, 18, 'c')])
+        self.assertEqual(list(right), [(0, 2, 'b'), (0, 22, 'c')])
+        left.join(right, 18)
+        self.assertEqual(left.overlapping(17, 19), \
+            [(10, 18, 'b'), (15, 18, 'c'), (18, 20, 'b'), (18, 40, 'c')])
+        self.assertRaises(ValueError, left.join, Interval_index([(0, 1, 'e')]), 0)
+
+class Genome_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.genome = Genome([('chr', Double_strand('aagaattcaaggaattcc'))])
+        self.genome.add_feature('chr', 0, 4, 'promoter')
+
+    def test_sites(self):
+        self.assertEqual(self.genome.annotate_sites('chr', ecori), 2)
+        self.assertEqual(self.genome.sites('chr', 8, 12), [(11, 17, ecori)])
+        self.assertEqual(self.genome.features('chr', 0, 2), \
+            [(0, 4, 'promoter')])
+        self.assertRaises(ValueError, self.genome.add_feature, 'chr', 5, 30, 'x')
+        ring = Genome([('p', Circular_strand(Double_strand('ttcaaaagaa')))])
+        ring.annotate_sites('p', ecori)
+        self.assertEqual(ring.sites('p'), [(0, 3, ecori), (7, 10, ecori)])
+
+    def test_split_ligate(self):
+        self.genome.split('chr', 3, 'left', 'right')
+        self.assertEqual(list(self.genome), ['left', 'right'])
+        self.assertEqual(self.genome.features('right'), [(0, 1, 'promoter')])
+        self.assertEqual(self.genome.ligate('left', 'right', 'chr'), \
+            Double_strand('aagaattcaaggaattcc'))
+        self.assertEqual(self.genome.features('chr'), \
+            [(0, 3, 'promoter'), (3, 4, 'promoter')])
+        self.assertFalse('left' in self.genome)
+        self.genome.add_segment('x', Double_strand(' a', 'tt'))
+        self.assertFalse(self.genome.ligate('chr', 'x', 'y'))
+        self.assertTrue('x' in self.genome)
+        self.assertRaises(ValueError, self.genome.split, 'chr', 2, 'x', 'z')
+        
+    def test_ligate_sticky_features(self):
+        left, right = Double_strand('aagaattcaa').restrict(ecori)
+        genome = Genome([('left', left), ('right', right)])
+        genome.add_features('left', [(0, 5, 'x'), (3, 7, 'site'), \
+                                     (5, 7, 'z')])
+        genome.add_features('right', [(0, 4, 'site'), (1, 2, 'y'), \
+                                      (2, 7, 'gene')])
+        self.assertEqual(genome.ligate('left', 'right', 'chr'), \
+            Double_strand('aagaattcaa'))
+        self.assertEqual(genome.features('chr'), \
+            [(0, 5, 'x'), (3, 7, 'site'), (4, 5, 'y'), (5, 7, 'z'), \
+             (5, 10, 'gene')])
+
+class Enzyme_library_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'emboss_e.test')
+        with open(self.filename, 'w') as f:
+            f.write("# REBASE version test\n#\n"
+                    "BglI\tGCCNNNNNGGC\t11\t2\t0\t7\t4\t0\t0\n"
+                    "BbvI\tGCAGC\t5\t2\t0\t13\t17\t0\t0\n"
+                    "AjuI\tGAANNNNNNNTTGG\t14\t4\t0\t-8\t-13\t25\t20\n"
+                    "Unknown\tACGT\t4\t0\t0\t0\t0\t0\t0\n")
+        self.text = 'ttGCCAGTCGGGCaaGCAGCaaGCTGCtt'
+
+    def tearDown(self):
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    def test_parse(self):
+        library = Enzyme_library(self.filename)
+        self.assertEqual(list(library), ['BglI', 'BbvI', 'AjuI'])
+        self.assertFalse('Unknown' in library)
+        self.assertEqual(library['BglI'].site_string(), 'GCCNNNNNGGC')
+        self.assertEqual((library['AjuI'].cut_site,
+                          library['AjuI'].bottom_cut), (-7, -12))
+        self.assertEqual(library['BbvI'].cut_positions(15), (28, 32))
+        self.assertEqual(library['BbvI'].cut_positions(22, False), (10, 14))
+        self.assertEqual(Restriction_enzyme('GCCNNNNNGGC', 7, 4),
+                         library['BglI'])
+        self.assertRaises(ValueError, Restriction_enzyme, 'GAXTC', 1)
+
+    def test_outside_cutters(self):
+        library = Enzyme_library(self.filename)
+        bbvi, ajui = library['BbvI'], library['AjuI']
+        # Cuts past the 3' end, and before the 5' end, are not made
+        dna = Double_strand('aaaaaGCAGCaaa')
+        self.assertEqual(Enzyme_panel([bbvi]).cut_sites(dna), [])
+        self.assertEqual(dna.restrict(bbvi), [dna])
+        self.assertEqual(Single_strand('aaaaaGCAGCaaa').restrict(bbvi), \
+            [Single_strand('aaaaaGCAGCaaa')])
+        self.assertEqual(panel_fragment_sizes(dna, [[bbvi]])[0].tolist(), [13])
+        dna = Double_strand('aaGCTGCaaaaaaaaaaaaaaaaaaaa')
+        self.assertEqual(Enzyme_panel([bbvi]).cut_sites(dna), [])
+        dna = Double_strand('GAAaaaaaaaTTGGccccccccccccc')
+        self.assertEqual(Enzyme_panel([ajui]).cut_sites(dna), [])
+        self.assertEqual(dna.restrict(ajui), [dna])
+        self.assertEqual(panel_fragment_sizes(dna, [[ajui]])[0].tolist(), [27])
+        # Cuts that land on the molecule are still made
+        dna = Double_strand('aaaaaGCAGC' + 'a' * 15)
+        self.assertEqual(Enzyme_panel([bbvi]).cut_sites(dna), [(18, 22)])
+        self.assertEqual([len(f) for f in dna.restrict(bbvi)], [22, 7])
+        self.assertEqual(panel_fragment_sizes(dna, [[bbvi]])[0].tolist(), \
+            [22, 7])
+        self.assertEqual(len(Single_strand('aaaaaGCAGC' + 'a' * 15) \
+                             .restrict(bbvi)), 2)
+
+    def test_cached_panel(self):
+        library = Enzyme_library(self.filename, self.dir)
+        sites = [(2, library['BglI'], True), (15, library['BbvI'], True),
+                 (22, library['BbvI'], False)]
+        self.assertEqual(library.panel().find_sites(self.text), sites)
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+        self.assertEqual(library.panel().find_sites(self.text), sites)
+        self.assertEqual(library.panel(['BbvI']).find_sites(self.text),
+                         sites[1:])
+
 def main():
     unittest.main()
 
@@ -1,48 +1,52 @@
 #!/usr/bin/env python
+import argparse
+import array
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import operator
+import os
 import re
+import shutil
+import string
 import sys
-import operator
+import tempfile
 import numpy as np
-import matplotlib.pyplot as plt
 
 class Word_counter:
-    def __init__(self, input_file, num_common_words):
+    # Counts are loaded from cache (an Analysis_cache) if it has them
+    def __init__(self, input_file, num_common_words, cache=None):
         self.input_file = input_file
-        text_it = String_iterator(input_file)
-        self.text = text_it.words
-        self.word_map = self.build_map(text_it)
+        self.text = String_iterator(input_file)
+        self.num_strings = 0
+        if cache is None:
+            self.word_map = self.build_map(self.text)
+        else:
+            self.index = cache.word_index(input_file)
+            self.num_strings = self.index.num_strings
+            self.word_map = self.index.word_map()
         self.num_common_words = num_common_words
-        self.num_strings = len(text_it.words)
     
-    # Build a map/dictionary of the words and number of occurrences
+    # Build a map/dictionary of the words and number of occurrences, and the
+    # positional index of the words, as they stream past: only a 4 byte id
+    # of each word of the text is kept
     def build_map(self, sit):
-        word_map = {}
-        for word in sit:
-            if word in word_map:
-                word_map[word] = word_map[word] + 1
-            else:
-                word_map[word] = 1;
-        return word_map
+        self.index = index_words(*number_words(sit))
+        self.num_strings = self.index.num_strings
+        return self.index.word_map()
         
-    # Get the k highest number of occurrences from the dict
-    def get_max_occurs(self, k):
-        occurs = self.word_map.values()
-        occurs.sort()
-        num_vals = len(occurs)
-        maxima = occurs[num_vals - k : num_vals]
-        return maxima
+    # Get the k highest number of occurrences from the dict, lowest first
+    # (the counts of commonest_words)
+    def get_max_occurs(self, k, strategy='partition'):
+        pairs = self.commonest_words(k, strategy)
+        return [pair[1] for pair in reversed(pairs)]
     
     # Return a list of tuples with the k most common words & num of occurrences
-    def commonest_words(self, k):
-        max_occurrences = self.get_max_occurs(k)
-        common_words = {}
-        for pair in self.word_map.items():
-            if pair[1] in max_occurrences:
-                common_words[pair[0]] = pair[1]
-        common_words = \
-            sorted(common_words.iteritems(), key=operator.itemgetter(1))
-        common_words.reverse()
-        return common_words
+    # (exactly k, or every word if there are fewer; see top_k)
+    def commonest_words(self, k, strategy='partition'):
+        return top_k(self.word_map, k, strategy)
         
     # Print a String of info about the word from the tuple (word, occurrences)
     def print_word_info(self, pair):
@@ -58,6 +62,7 @@ class Word_counter:
         num_occurrences = filter(lambda x: x > thresh_num, num_occurrences)
         num_occurrences = [self.get_percent(x) for x in num_occurrences]
         ind = range(len(num_occurrences))
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots()
         rects = ax.bar(ind, num_occurrences, width=1, color='b',edgecolor='none')
         #Add labels, etc.
@@ -68,30 +73,33 @@ class Word_counter:
         plt.draw()
         
     # Plot distribution of a word in the text file (Like Kindle x-ray feature)
-    # Current simple version: basically a histogram
-    def word_xray(self, word):
-        word = word.lower()
-        num_text_divs = 500
-        text_div_size = self.num_strings / num_text_divs
-        #text_div_size = 100
-        text_divs = range(0, self.num_strings, text_div_size)
-        num_occurrences = []
-        for i in text_divs:
-            snippet = self.text[i:i + text_div_size]
-            count = len(filter(lambda s: s == word, snippet))
-            num_occurrences.append(count)
-        occurred = [min(x, 1) for x in num_occurrences]
+    # Current simple version: basically a histogram.  Several words are
+    # plotted one above the other.
+    def word_xray(self, words, num_text_divs=500):
+        if isinstance(words, basestring):
+            words = [words]
+        # Short texts get one division per word
+        num_text_divs = max(1, min(num_text_divs, self.num_strings))
+        width = 1.0 / num_text_divs
+        ind = np.arange(num_text_divs) * width
         # Create plot
-        ind = np.linspace(0, 1, num=len(num_occurrences))
-        width = ind[1]-ind[0]
-        fig, ax = plt.subplots()
-        rects = ax.bar(ind, occurred, width, color='r', edgecolor='none')
-        ax.set_title('Distribution of "' + word + '" in text')
-        ax.set_xlabel('Text Progression')
-        ax.set_xlim((0, 1))
-        ax.get_yaxis().set_visible(False)
-        ax.set_aspect(.2)
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(len(words), 1, squeeze=False)
+        for ax, word in zip(axes[:, 0], words):
+            word = word.lower()
+            occurred = np.minimum(self.index.histogram(word, num_text_divs), 1)
+            rects = ax.bar(ind, occurred, width, color='r', edgecolor='none')
+            ax.set_title('Distribution of "' + word + '" in text')
+            ax.set_xlabel('Text Progression')
+            ax.set_xlim((0, 1))
+            ax.get_yaxis().set_visible(False)
+            ax.set_aspect(.2)
         plt.draw()
+    
+    # Return the positions of word1 with word2 no more than window words
+    # before or after it
+    def cooccurrences(self, word1, word2, window):
+        return self.index.cooccurrences(word1.lower(), word2.lower(), window)
         
     # Get percent of total words this numWords is
     def get_percent(self, num_words):
@@ -105,56 +113,535 @@ class Word_counter:
             s = "s"
         return s
 
+# Sort key putting higher counts first, then words alphabetically
+def rank_key(pair):
+    return (-pair[1], pair[0])
+
+# Top k by a heap of the k best so far: O(V log k)
+def top_k_heap(word_map, k):
+    return heapq.nsmallest(k, word_map.iteritems(), key=rank_key)
+
+# Top k by partial selection of the k-th highest count over an array of the
+# counts: O(V), plus sorting the k chosen words
+def top_k_partition(word_map, k):
+    words = word_map.keys()
+    counts = np.fromiter(word_map.itervalues(), np.int64, len(words))
+    if k < len(words):
+        threshold = np.partition(counts, len(counts) - k)[len(counts) - k]
+        chosen = np.flatnonzero(counts > threshold)
+        # Only as many of the words tied at the threshold as fit, by name
+        tied = [words[i] for i in np.flatnonzero(counts == threshold)]
+        tied = heapq.nsmallest(k - len(chosen), tied)
+    else:
+        chosen = np.arange(len(words))
+        tied = []
+    pairs = zip([words[i] for i in chosen.tolist()], counts[chosen].tolist())
+    pairs.extend([(word, int(threshold)) for word in tied])
+    # Sorting by word, then stably by count, is faster than by a tuple key
+    pairs.sort()
+    pairs.sort(key=operator.itemgetter(1), reverse=True)
+    return pairs
+
+# Top k by grouping the words by count (counts of counts) and taking whole
+# groups from the highest count down: O(V), plus sorting the groups taken
+def top_k_buckets(word_map, k):
+    buckets = {}
+    for word, count in word_map.iteritems():
+        if count in buckets:
+            buckets[count].append(word)
+        else:
+            buckets[count] = [word]
+    pairs = []
+    for count in sorted(buckets, reverse=True):
+        needed = k - len(pairs)
+        if needed <= 0:
+            break
+        bucket = buckets[count]
+        if len(bucket) > needed:
+            bucket = heapq.nsmallest(needed, bucket)
+        else:
+            bucket.sort()
+        pairs.extend([(word, count) for word in bucket])
+    return pairs
+
+TOP_K_STRATEGIES = {'heap': top_k_heap, 'partition': top_k_partition,
+                    'buckets': top_k_buckets}
+
+# Return exactly k (word, occurrences) tuples (or every word, if there are
+# fewer), most common first.  Words with the same count are in alphabetical
+# order, and the alphabetically first are kept when a tie crosses k.
+def top_k(word_map, k, strategy='partition'):
+    if strategy not in TOP_K_STRATEGIES:
+        raise ValueError('Unknown top-k strategy: ' + strategy)
+    if k <= 0:
+        return []
+    return TOP_K_STRATEGIES[strategy](word_map, k)
+
+# Return a list of the words, by id, from a dict of words to ids
+def vocabulary(word_ids):
+    words = [None] * len(word_ids)
+    for word, i in word_ids.iteritems():
+        words[i] = word
+    return words
+
+# Give every distinct word an id, in order of first appearance, and return
+# the words by id and the id of every word of the text (a NumPy array)
+def number_words(sit):
+    word_ids = {}
+    text_ids = array.array('i')
+    for word in sit:
+        text_ids.append(word_ids.setdefault(word, len(word_ids)))
+    if not text_ids:
+        return [], np.zeros(0, np.int32)
+    return vocabulary(word_ids), np.frombuffer(text_ids, np.int32)
+
+# Positional inverted index: the positions of each word in the text, sorted,
+# stored together in one array grouped by word id.  Looking up a word costs
+# time in proportion to how often it occurs, not to the length of the text.
+# See index_words to build one from the text.
+class Word_index:
+    def __init__(self, words, counts, positions):
+        self.words = words
+        self.ids = dict((word, i) for i, word in enumerate(words))
+        self.num_strings = len(positions)
+        self.counts = counts
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+        self.positions = positions
+    
+    # Write the index to files in a directory: the words, one per line, and
+    # the arrays in NumPy's format
+    def save(self, dirname):
+        with open(os.path.join(dirname, 'words.txt'), 'w') as f:
+            f.write('\n'.join(self.words))
+        np.save(os.path.join(dirname, 'counts.npy'), self.counts)
+        np.save(os.path.join(dirname, 'positions.npy'), self.positions)
+    
+    # Read an index written by save.  The arrays are memory-mapped, so only
+    # the positions of the words looked up are read from disk.
+    @staticmethod
+    def load(dirname):
+        with open(os.path.join(dirname, 'words.txt')) as f:
+            words = f.read()
+        words = words.split('\n') if words else []
+        counts = np.load(os.path.join(dirname, 'counts.npy'), mmap_mode='r')
+        positions = np.load(os.path.join(dirname, 'positions.npy'),
+                            mmap_mode='r')
+        if len(counts) != len(words) or counts.sum() != len(positions):
+            raise ValueError('Inconsistent word index in ' + dirname)
+        return Word_index(words, counts, positions)
+    
+    # Return the id of every word of the text, in order
+    def text_ids(self):
+        text_ids = np.empty(self.num_strings, np.int32)
+        text_ids[self.positions] = np.repeat(
+            np.arange(len(self.words), dtype=np.int32), self.counts)
+        return text_ids
+    
+    # Return the words and their number of occurrences as a dict
+    def word_map(self):
+        return dict(zip(self.words, self.counts.tolist()))
+    
+    # Return the sorted positions of a word in the text (none if it is not
+    # in the text)
+    def positions_of(self, word):
+        i = self.ids.get(word)
+        if i is None:
+            return self.positions[:0]
+        return self.positions[self.starts[i]:self.starts[i + 1]]
+    
+    # Return the number of occurrences of a word in each of num_divs equal
+    # divisions of the text
+    def histogram(self, word, num_divs):
+        return np.histogram(self.positions_of(word), num_divs,
+                            (0, max(1, self.num_strings)))[0]
+    
+    # Return the positions of word1 with word2 no more than window words
+    # before or after it
+    def cooccurrences(self, word1, word2, window):
+        first = self.positions_of(word1)
+        second = self.positions_of(word2)
+        lo = np.searchsorted(second, first - window)
+        hi = np.searchsorted(second, first + window, side='right')
+        if word1 == word2:
+            # A word is not near itself
+            return first[hi - lo > 1]
+        return first[hi > lo]
+
+# Build the Word_index of a text from its words by id and the id of every
+# word of the text
+def index_words(words, text_ids):
+    counts = np.bincount(text_ids, minlength=len(words))
+    # A stable sort keeps each word's positions in order
+    positions = np.argsort(text_ids, kind='mergesort').astype(np.int32)
+    return Word_index(words, counts, positions)
+
+# Bump when the tokenizer or the cache format changes, so old entries are not
+# used
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'word_counter')
+
+# Return the SHA-1 of the contents of a file, read a chunk at a time
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Word indexes of files saved in a directory, keyed by the contents of the
+# files, so a file is only counted again when it changes.  The size and
+# modification time of every file seen are kept, and a file is only hashed
+# again when they change.
+class Analysis_cache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.sources_file = os.path.join(cache_dir, 'sources.json')
+        try:
+            with open(self.sources_file) as f:
+                self.sources = json.load(f)
+        except (IOError, ValueError):
+            self.sources = {}
+        self.changed = False
+    
+    # Return the content hash of a file
+    def key(self, filename):
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        seen = self.sources.get(path)
+        if seen and seen[0] == stat.st_mtime and seen[1] == stat.st_size:
+            return seen[2]
+        digest = file_digest(path)
+        self.sources[path] = [stat.st_mtime, stat.st_size, digest]
+        self.changed = True
+        return digest
+    
+    # Save the sizes, modification times and hashes of the files seen
+    def flush(self):
+        if not self.changed:
+            return
+        self.make_dir()
+        fd, temp = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.sources, f)
+        os.rename(temp, self.sources_file)
+        self.changed = False
+    
+    def make_dir(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+    
+    def entry_dir(self, filename):
+        return os.path.join(self.cache_dir,
+                            '%s-%d' % (self.key(filename), CACHE_VERSION))
+    
+    # Return the saved index of a file, or None if its contents were never
+    # counted
+    def load(self, filename):
+        entry = self.entry_dir(filename)
+        if not os.path.isdir(entry):
+            return None
+        try:
+            return Word_index.load(entry)
+        except (IOError, ValueError):
+            # Unreadable entries are counted again
+            return None
+    
+    # Save the index of a file
+    def save(self, filename, index):
+        entry = self.entry_dir(filename)
+        self.make_dir()
+        # Written elsewhere first, so no one loads half an entry
+        temp = tempfile.mkdtemp(dir=self.cache_dir)
+        index.save(temp)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            # Saved by someone else meanwhile
+            shutil.rmtree(temp)
+    
+    # Return the index of a file, loaded from the cache or counted and saved
+    def word_index(self, filename):
+        index = self.load(filename)
+        if index is None:
+            index = index_words(*number_words(String_iterator(filename)))
+            self.save(filename, index)
+        self.flush()
+        return index
+
+# A word is a run of letters, digits, underscores, hyphens and apostrophes
+WORD_CHARS = string.ascii_letters + string.digits + "_-'"
+WORD_PATTERN = re.compile(r"[a-z0-9_\-']+")
+CHUNK_SIZE = 1 << 16
+
+# Generate the lowercase words of a file, reading it a chunk at a time.  A
+# word cut off at the end of a chunk is held back and finished by the next.
+def tokenize(f, chunk_size=CHUNK_SIZE):
+    partial = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        chunk = partial + chunk
+        end = len(chunk.rstrip(WORD_CHARS))
+        partial = chunk[end:]
+        for word in WORD_PATTERN.findall(chunk[:end].lower()):
+            yield word
+    if partial:
+        for word in WORD_PATTERN.findall(partial.lower()):
+            yield word
+
+# Iterate over the words of a file, streaming them from disk every time
 class String_iterator:
-    def __init__(self, filename):
-        self.words = []
-        f = open(filename, 'r')
-        lines = f.readlines()
-        for line in lines:
-            self.words.extend(line.split(" "))
-        for i in range(len(self.words)):
-            self.words[i] = re.sub(r"[^a-zA-Z0-9_\-']", '', self.words[i])
-        # This filter is changing the indexing and messing things up, I think
-        self.words = filter(None, self.words)
-        self.words = map(lambda x:x.lower(), self.words)
-        self.ind = 0
-        self.size = len(self.words)
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        self.filename = filename
+        self.chunk_size = chunk_size
         
     def __iter__(self):
-        return self
+        with open(self.filename, 'r') as f:
+            for word in tokenize(f, self.chunk_size):
+                yield word
+
+# Files are split into pieces of about this many bytes for the workers
+PIECE_SIZE = 1 << 24
+
+# Iterate over the words of several files in turn
+class Corpus_iterator:
+    def __init__(self, filenames, chunk_size=CHUNK_SIZE):
+        self.filenames = filenames
+        self.chunk_size = chunk_size
+        
+    def __iter__(self):
+        for filename in self.filenames:
+            for word in String_iterator(filename, self.chunk_size):
+                yield word
+
+# Count the words of many files (or every file under directories) across a
+# pool of processes, keeping the counts of each file as well as the totals
+class Corpus_counter(Word_counter):
+    # Files in cache (an Analysis_cache) are loaded from it, and the others
+    # are saved to it once counted
+    def __init__(self, paths, num_common_words, processes=None,
+                 piece_size=PIECE_SIZE, cache=None):
+        self.input_file = None
+        self.filenames = corpus_files(paths)
+        self.text = Corpus_iterator(self.filenames)
+        self.num_common_words = num_common_words
+        self.file_maps = dict((f, {}) for f in self.filenames)
+        self.file_strings = dict((f, 0) for f in self.filenames)
+        order = []
+        cached = []
+        pieces = []
+        for filename in self.filenames:
+            index = cache.load(filename) if cache is not None else None
+            if index is None:
+                file_pieces = split_file(filename, piece_size)
+                pieces.extend(file_pieces)
+                order.extend(file_pieces)
+            else:
+                piece = (filename, 0, None)
+                cached.append((piece, index.words, index.text_ids()))
+                order.append(piece)
+        if processes == 1 or not pieces:
+            piece_ids = self.merge(order, cached + map(count_piece, pieces))
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                piece_ids = self.merge(order, itertools.chain(
+                    cached, pool.imap_unordered(count_piece, pieces)))
+            finally:
+                pool.close()
+                pool.join()
+        if cache is not None:
+            self.save_counted(cache, pieces, piece_ids)
+            cache.flush()
     
-    def next(self):
-        try:
-            result = self.words[self.ind]
-        except IndexError:
-            raise StopIteration
-        self.ind += 1
-        return result
-            
-# Get filename or raise exception
-if len(sys.argv) < 2:
-    raise IndexError('No filename provided')
-else:
-    filename = sys.argv[1]
-
-# Get number of most common words to produce
-if len(sys.argv) < 3:
-    num_words = 25
-else:
-    num_words = int(sys.argv[2])
-
-# Create the counter
-counter = Word_counter(filename, num_words)
-
-# Print the results
-print "Total words in file: " + str(counter.num_strings)
-print "Unique words in file: " + str(len(counter.word_map))
-print str(counter.num_common_words) + " most used word" + counter.add_s() + ":"
-for pair in counter.commonest_words(counter.num_common_words):
-    counter.print_word_info(pair)
-
-# Graphs:
-counter.plot_words_freq()
-if len(sys.argv) >= 4:
-    counter.word_xray(sys.argv[3])
-plt.show()
+    # Save the index of every file counted (rather than loaded) to cache,
+    # from its pieces
+    def save_counted(self, cache, pieces, piece_ids):
+        by_file = {}
+        for piece in pieces:
+            by_file.setdefault(piece[0], []).append(piece_ids[piece])
+        for filename, parts in by_file.iteritems():
+            ids, text_ids = np.unique(np.concatenate(parts),
+                                      return_inverse=True)
+            words = [self.index.words[i] for i in ids.tolist()]
+            cache.save(filename, index_words(words, text_ids))
+    
+    # Add the counts of pieces of files, as they arrive, to the counts of
+    # their files, and renumber their words with ids for the whole corpus.
+    # The index puts the pieces back in order.  Returns the renumbered ids of
+    # the words of every piece.
+    def merge(self, pieces, results):
+        word_ids = {}
+        piece_ids = {}
+        for piece, words, text_ids in results:
+            filename = piece[0]
+            counts = np.bincount(text_ids, minlength=len(words))
+            add_counts(self.file_maps[filename],
+                       dict(zip(words, counts.tolist())))
+            self.file_strings[filename] += len(text_ids)
+            renumber = np.array([word_ids.setdefault(word, len(word_ids))
+                                 for word in words], np.int32)
+            piece_ids[piece] = renumber[text_ids]
+        text_ids = np.concatenate([np.zeros(0, np.int32)] +
+                                  [piece_ids[piece] for piece in pieces])
+        self.index = index_words(vocabulary(word_ids), text_ids)
+        self.num_strings = len(text_ids)
+        self.word_map = self.index.word_map()
+        return piece_ids
+
+# Return the files named, and every text file under the directories named,
+# sorted.  Binary files under the directories are skipped, with a warning.
+def corpus_files(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for f in files:
+                    filename = os.path.join(root, f)
+                    if is_text_file(filename):
+                        filenames.append(filename)
+                    else:
+                        sys.stderr.write('Skipping binary file: ' +
+                                         filename + '\n')
+        elif os.path.isfile(path):
+            filenames.append(path)
+        else:
+            raise IOError('No such file or directory: ' + path)
+    return sorted(set(filenames))
+
+# Return whether a file looks like text: no NUL bytes in its first chunk (as
+# in images, archives and the like).  Any 8-bit encoding counts as text, as
+# the tokenizer only looks for ASCII word characters.
+def is_text_file(filename):
+    with open(filename, 'rb') as f:
+        return '\0' not in f.read(CHUNK_SIZE)
+
+# Return the first position at or after pos (or the end of the file) that
+# cannot be inside a word, so a file split there splits no word
+def word_boundary(f, pos):
+    f.seek(pos)
+    while True:
+        block = f.read(4096)
+        if not block:
+            return pos
+        word_end = len(block) - len(block.lstrip(WORD_CHARS))
+        if word_end < len(block):
+            return pos + word_end
+        pos += len(block)
+
+# Return (filename, start, end) byte ranges of about piece_size covering the
+# file, ending at word boundaries
+def split_file(filename, piece_size=PIECE_SIZE):
+    size = os.path.getsize(filename)
+    pieces = []
+    start = 0
+    with open(filename, 'r') as f:
+        while start < size:
+            end = size
+            if start + piece_size < size:
+                end = word_boundary(f, start + piece_size)
+            pieces.append((filename, start, end))
+            start = end
+    return pieces
+
+# Read at most size bytes of a file, from where it is, like a file
+class File_range:
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+        
+    def read(self, n):
+        data = self.f.read(min(n, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+# Worker: number the words in a byte range of a file (see number_words)
+def count_piece(piece):
+    filename, start, end = piece
+    with open(filename, 'r') as f:
+        f.seek(start)
+        words, text_ids = number_words(tokenize(File_range(f, end - start)))
+    return piece, words, text_ids
+
+# Add the counts of one map of words into another
+def add_counts(word_map, counts):
+    for word, count in counts.iteritems():
+        if word in word_map:
+            word_map[word] += count
+        else:
+            word_map[word] = count
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Word usage statistics of a text file, or of a corpus of "
+                    "many files counted in parallel")
+    parser.add_argument('paths', nargs='+',
+                        help="text files and/or directories of text files "
+                             "(the old form TEXTFILE [NUMWORDS [SEARCHWORD]] "
+                             "also works)")
+    parser.add_argument('-n', '--num-words', type=int, default=25,
+                        help="number of most used words to list (default 25)")
+    parser.add_argument('-x', '--xray', metavar='SEARCHWORD', nargs='+',
+                        help="show the distribution of words through the text")
+    parser.add_argument('-w', '--window', type=int,
+                        help="also count how often each pair of the x-ray "
+                             "words occur within this many words")
+    parser.add_argument('-j', '--processes', type=int,
+                        help="worker processes for a corpus (default: all "
+                             "cores)")
+    parser.add_argument('--per-file', action='store_true',
+                        help="also print the totals of every file")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="where to keep the counts of files analyzed "
+                             "before (default " + DEFAULT_CACHE_DIR + ")")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="count the words again and do not save them")
+    args = parser.parse_args()
+    paths = args.paths
+    # Word_counter.py TEXTFILE [NUMWORDS [SEARCHWORD]]
+    if 2 <= len(paths) <= 3 and paths[1].isdigit() and \
+            not os.path.exists(paths[1]):
+        args.num_words = int(paths[1])
+        if len(paths) == 3:
+            args.xray = paths[2:]
+        paths = paths[:1]
+
+    # Create the counter
+    cache = None if args.no_cache else Analysis_cache(args.cache_dir)
+    if len(paths) == 1 and os.path.isfile(paths[0]):
+        counter = Word_counter(paths[0], args.num_words, cache)
+    else:
+        counter = Corpus_counter(paths, args.num_words, args.processes,
+                                 cache=cache)
+
+    # Print the results
+    print "Total words in file: " + str(counter.num_strings)
+    print "Unique words in file: " + str(len(counter.word_map))
+    print str(counter.num_common_words) + " most used word" + \
+        counter.add_s() + ":"
+    for pair in counter.commonest_words(counter.num_common_words):
+        counter.print_word_info(pair)
+    if args.xray and args.window is not None:
+        print "Words within " + str(args.window) + " words of each other:"
+        for i, word1 in enumerate(args.xray):
+            for word2 in args.xray[i + 1:]:
+                near = counter.cooccurrences(word1, word2, args.window)
+                print "\t" + word1 + "\t" + word2 + "\t" + str(len(near))
+    if args.per_file and isinstance(counter, Corpus_counter):
+        print "Words per file (total, unique):"
+        for filename in counter.filenames:
+            print "\t" + filename + "\t" + \
+                str(counter.file_strings[filename]) + "\t" + \
+                str(len(counter.file_maps[filename]))
+
+    # Graphs (matplotlib is only needed for these):
+    import matplotlib.pyplot as plt
+    counter.plot_words_freq()
+    if args.xray:
+        counter.word_xray(args.xray)
+    plt.show()
+
+if __name__ == '__main__':
+    main()
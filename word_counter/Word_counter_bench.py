@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# Time the top-k strategies of Word_counter on a synthetic vocabulary
+import argparse
+import time
+import numpy as np
+from Word_counter import TOP_K_STRATEGIES, top_k
+
+# Build a vocabulary of n words with Zipf-distributed counts (many ties)
+def zipf_vocabulary(n, seed=0):
+    rng = np.random.RandomState(seed)
+    counts = np.minimum(rng.zipf(1.5, n), 10 ** 9)
+    return dict(('w%d' % i, int(count)) for i, count in enumerate(counts))
+
+# Return the best wall-clock time of fn() over repeat runs, and its result
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the top-k strategies of Word_counter")
+    parser.add_argument('--words', type=int, default=10 ** 6,
+                        help="vocabulary size (default 10^6)")
+    parser.add_argument('--k', type=int, nargs='+',
+                        default=[10, 10 ** 3, 10 ** 4, 10 ** 5],
+                        help="numbers of top words to select")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per measurement; the best is kept")
+    args = parser.parse_args()
+    word_map = zipf_vocabulary(args.words)
+    print "%d words, %d distinct counts" % \
+        (len(word_map), len(set(word_map.itervalues())))
+    strategies = sorted(TOP_K_STRATEGIES)
+    print "%10s" % "k" + "".join(["%12s" % s for s in strategies])
+    for k in args.k:
+        row = "%10d" % k
+        expected = None
+        for strategy in strategies:
+            seconds, result = best_time(
+                lambda: top_k(word_map, k, strategy), args.repeat)
+            if expected is None:
+                expected = result
+            elif result != expected:
+                raise AssertionError(strategy + " disagrees at k = %d" % k)
+            row += "%10.3f s" % seconds
+        print row
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+from Word_counter import *
+
+ILIAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iliad.txt')
+
+TEXT = "Sing, O goddess, the anger of Achilles son of Peleus, that brought " \
+       "countless ills upon the Achaeans.  Many a brave soul did it send " \
+       "hurrying down to Hades, and many a hero did it yield a prey to dogs " \
+       "and vultures -- for so were the counsels of Jove fulfilled, from " \
+       "the day on which the son of Atreus, king of men, and great " \
+       "Achilles, first fell out with one another.  Don't fall-out, " \
+       "o'er-hasty men_2!"
+
+class Tokenize_tests(unittest.TestCase):
+
+    def test_chunk_boundaries(self):
+        # Every chunk size splits some words across chunks
+        words = WORD_PATTERN.findall(TEXT.lower())
+        for chunk_size in [1, 2, 3, 5, 7, 16, 64, len(TEXT), 2 * len(TEXT)]:
+            streamed = list(tokenize(StringIO.StringIO(TEXT), chunk_size))
+            self.assertEqual(streamed, words)
+        self.assertEqual(list(tokenize(StringIO.StringIO(''), 4)), [])
+        self.assertEqual(list(tokenize(StringIO.StringIO('  , '), 1)), [])
+
+    def test_file_counts(self):
+        with open(ILIAD) as f:
+            words = WORD_PATTERN.findall(f.read().lower())
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for chunk_size in [13, 4096, CHUNK_SIZE]:
+            index = index_words(*number_words(String_iterator(ILIAD,
+                                                              chunk_size)))
+            self.assertEqual(index.num_strings, len(words))
+            self.assertEqual(index.word_map(), counts)
+
+class Top_k_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.word_map = {'the': 9, 'of': 7, 'and': 7, 'to': 7, 'a': 3,
+                         'in': 3, 'he': 1, 'his': 1}
+
+    def test_strategies_agree(self):
+        ranked = sorted(self.word_map.items(), key=rank_key)
+        for k in range(len(self.word_map) + 3):
+            for strategy in TOP_K_STRATEGIES:
+                self.assertEqual(top_k(self.word_map, k, strategy),
+                                 ranked[:k])
+        self.assertRaises(ValueError, top_k, self.word_map, 3, 'sort')
+
+    def test_ties(self):
+        # The tie at 7 crosses k: the alphabetically first are kept, and
+        # words with the same count come in alphabetical order
+        for strategy in TOP_K_STRATEGIES:
+            self.assertEqual(top_k(self.word_map, 3, strategy),
+                             [('the', 9), ('and', 7), ('of', 7)])
+            self.assertEqual(top_k(self.word_map, 6, strategy)[4:],
+                             [('a', 3), ('in', 3)])
+
+    def test_edge_sizes(self):
+        for strategy in TOP_K_STRATEGIES:
+            self.assertEqual(top_k(self.word_map, 0, strategy), [])
+            self.assertEqual(top_k(self.word_map, -1, strategy), [])
+            self.assertEqual(len(top_k(self.word_map, 100, strategy)), 8)
+            self.assertEqual(top_k({}, 5, strategy), [])
+
+    def test_max_occurs(self):
+        counter = Word_counter(ILIAD, 10)
+        counter.word_map = self.word_map
+        self.assertEqual(counter.get_max_occurs(4), [7, 7, 7, 9])
+        self.assertEqual(counter.get_max_occurs(0), [])
+
+class Word_index_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.words = 'hector achilles spear hector shield achilles'.split()
+        self.index = index_words(*number_words(self.words))
+
+    def test_positions(self):
+        self.assertEqual(self.index.num_strings, 6)
+        self.assertEqual(self.index.positions_of('hector').tolist(), [0, 3])
+        self.assertEqual(self.index.positions_of('troy').tolist(), [])
+        self.assertEqual([self.index.words[i]
+                          for i in self.index.text_ids()], self.words)
+
+    def test_short_histogram(self):
+        # Fewer words than bins: each word lands in its own bin
+        hist = self.index.histogram('achilles', 10)
+        self.assertEqual(len(hist), 10)
+        self.assertEqual(np.flatnonzero(hist).tolist(), [1, 8])
+        self.assertEqual(self.index.histogram('troy', 10).tolist(), [0] * 10)
+        empty = index_words(*number_words([]))
+        self.assertEqual(empty.histogram('troy', 4).tolist(), [0] * 4)
+
+    def test_cooccurrence_edges(self):
+        # Windows reaching past the start and end of the text
+        self.assertEqual(
+            self.index.cooccurrences('hector', 'achilles', 1).tolist(), [0])
+        self.assertEqual(
+            self.index.cooccurrences('achilles', 'shield', 1).tolist(), [5])
+        self.assertEqual(
+            self.index.cooccurrences('hector', 'achilles', 10).tolist(),
+            [0, 3])
+        self.assertEqual(
+            self.index.cooccurrences('hector', 'hector', 2).tolist(), [])
+        self.assertEqual(
+            self.index.cooccurrences('hector', 'hector', 3).tolist(), [0, 3])
+        self.assertEqual(
+            self.index.cooccurrences('hector', 'troy', 100).tolist(), [])
+
+class Corpus_counter_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'books'))
+        with open(ILIAD) as f:
+            iliad = f.read()
+        self.texts = {'a.txt': TEXT, 'books/iliad': iliad[:50000],
+                      'books/iliad-end.txt': iliad[-20000:], 'empty.txt': '',
+                      'latin.txt': 'Caf\xe9 au lait, \xe0 la carte'}
+        for name, text in self.texts.iteritems():
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_corpus_files(self):
+        cover = os.path.join(self.dir, 'books', 'cover.png')
+        with open(cover, 'wb') as f:
+            f.write('\x89PNG\r\n\x1a\n\0\0\0\rIHDR')
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            filenames = corpus_files([self.dir])
+            warnings = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        # Latin-1 text is counted; only the binary file is skipped, noisily
+        self.assertEqual(filenames, sorted(os.path.join(self.dir, name)
+                                           for name in self.texts))
+        self.assertEqual(warnings, 'Skipping binary file: ' + cover +
+                         '\n')
+        self.assertEqual(corpus_files([cover]), [cover])
+        self.assertRaises(IOError, corpus_files, [cover + '.missing'])
+        counter = Corpus_counter([os.path.join(self.dir, 'latin.txt')], 3, 1)
+        self.assertEqual(counter.word_map,
+                         {'caf': 1, 'au': 1, 'lait': 1, 'la': 1, 'carte': 1})
+
+    def test_pieces_match_single_pass(self):
+        single = Corpus_counter([self.dir], 10, 1)
+        pieces = split_file(os.path.join(self.dir, 'books/iliad'), 1000)
+        self.assertTrue(len(pieces) > 40)
+        pooled = Corpus_counter([self.dir], 10, 2, 1000)
+        self.assertEqual(pooled.num_strings, single.num_strings)
+        self.assertEqual(pooled.word_map, single.word_map)
+        self.assertEqual(pooled.file_maps, single.file_maps)
+        self.assertEqual(pooled.file_strings, single.file_strings)
+        self.assertEqual(pooled.commonest_words(10),
+                         single.commonest_words(10))
+        words = WORD_PATTERN.findall(''.join(
+            self.texts[name] + ' ' for name in sorted(self.texts)).lower())
+        self.assertEqual([pooled.index.words[i]
+                          for i in pooled.index.text_ids()], words)
+
+    def test_positions_match_file(self):
+        corpus = Corpus_counter([self.dir], 10, 2, 1000)
+        start = 0
+        for filename in corpus.filenames:
+            counter = Word_counter(filename, 10)
+            end = start + counter.num_strings
+            for word in ['the', 'achilles', 'son', 'patroclus']:
+                positions = corpus.index.positions_of(word)
+                positions = positions[(positions >= start) &
+                                      (positions < end)] - start
+                self.assertEqual(positions.tolist(),
+                                 counter.index.positions_of(word).tolist())
+            start = end
+        self.assertEqual(start, corpus.num_strings)
+
+class Analysis_cache_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, 'cache')
+        self.filename = os.path.join(self.dir, 'text.txt')
+        self.write(TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(self.filename, 'w') as f:
+            f.write(text)
+
+    def cache(self):
+        return Analysis_cache(self.cache_dir)
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.cache_dir)
+                      if name != 'sources.json')
+
+    def assertSameCounts(self, counter, fresh):
+        self.assertEqual(counter.num_strings, fresh.num_strings)
+        self.assertEqual(counter.word_map, fresh.word_map)
+        self.assertEqual(counter.commonest_words(10),
+                         fresh.commonest_words(10))
+        self.assertEqual(counter.index.text_ids().tolist(),
+                         fresh.index.text_ids().tolist())
+
+    def test_hit(self):
+        fresh = Word_counter(self.filename, 10)
+        Word_counter(self.filename, 10, self.cache())
+        self.assertEqual(len(self.entries()), 1)
+        cache = self.cache()
+        self.assertTrue(cache.load(self.filename) is not None)
+        counter = Word_counter(self.filename, 10, cache)
+        # Loaded from the saved arrays, not counted again
+        self.assertTrue(isinstance(counter.index.positions, np.memmap))
+        self.assertSameCounts(counter, fresh)
+        self.assertEqual(counter.cooccurrences('achilles', 'son', 5).tolist(),
+                         fresh.cooccurrences('achilles', 'son', 5).tolist())
+        corpus = Corpus_counter([self.filename], 10, 1, cache=cache)
+        self.assertSameCounts(corpus, fresh)
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_edit_invalidates(self):
+        cache = self.cache()
+        Word_counter(self.filename, 10, cache)
+        self.write(TEXT + " Achilles")
+        counter = Word_counter(self.filename, 10, self.cache())
+        self.assertSameCounts(counter, Word_counter(self.filename, 10))
+        self.assertEqual(len(self.entries()), 2)
+        # The same size and a new modification time: hashed again
+        self.write(TEXT.replace('Sing', 'Sang') + " Achilles")
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+        counter = Word_counter(self.filename, 10, self.cache())
+        self.assertEqual(counter.word_map.get('sang'), 1)
+        self.assertFalse('sing' in counter.word_map)
+        self.assertEqual(len(self.entries()), 3)
+
+    def test_empty_file(self):
+        self.write('')
+        Word_counter(self.filename, 10, self.cache())
+        index = self.cache().load(self.filename)
+        self.assertEqual(index.num_strings, 0)
+        self.assertEqual(index.words, [])
+        self.assertEqual(index.positions_of('troy').tolist(), [])
+        counter = Word_counter(self.filename, 10, self.cache())
+        self.assertEqual(counter.word_map, {})
+        self.assertEqual(counter.commonest_words(10), [])
+        self.assertEqual(counter.index.histogram('troy', 4).tolist(), [0] * 4)
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()